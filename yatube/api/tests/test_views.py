@@ -0,0 +1,82 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(
+            username='Author', first_name='Лев', last_name='Толстой')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        self.post = Post.objects.create(
+            text='пост', author=self.author, group=self.group)
+
+    def test_feed_serializes_posts(self):
+        """ Лента отдаёт посты в JSON с курсорами """
+        response = self.client.get(reverse('api:post_list'))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['results'], [{
+            'id': self.post.pk,
+            'text': 'пост',
+            'pub_date': data['results'][0]['pub_date'],
+            'author': 'Author',
+            'group': 'group',
+            'image': None,
+            'comments_count': 0,
+            'views_count': 0,
+        }])
+        self.assertIsNone(data['next'])
+
+    @override_settings(POST_LENGTH=1)
+    def test_cursor_links_walk_the_feed(self):
+        older = self.post
+        newer = Post.objects.create(text='новый', author=self.author)
+        first = self.client.get(reverse('api:post_list')).json()
+        self.assertEqual(first['results'][0]['id'], newer.pk)
+        second = self.client.get(first['next']).json()
+        self.assertEqual(second['results'][0]['id'], older.pk)
+        self.assertIsNone(second['next'])
+
+    def test_etag_returns_304_until_content_changes(self):
+        """ Повторный запрос с If-None-Match получает 304 без тела """
+        url = reverse('api:group_detail', kwargs={'slug': 'group'})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Comment.objects.create(post=self.post, author=self.author, text='к')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['comments_count'], 1)
+
+    def test_detail_comments_and_profile(self):
+        Comment.objects.create(post=self.post, author=self.author, text='к')
+        detail = self.client.get(
+            reverse('api:post_detail', kwargs={'post_id': self.post.pk}))
+        self.assertEqual(detail.json()['text'], 'пост')
+        comments = self.client.get(
+            reverse('api:comment_list', kwargs={'post_id': self.post.pk}))
+        self.assertEqual(comments.json()['results'][0]['text'], 'к')
+        profile = self.client.get(
+            reverse('api:profile', kwargs={'username': 'Author'})).json()
+        self.assertEqual(profile['profile']['full_name'], 'Лев Толстой')
+        self.assertEqual(profile['profile']['posts_count'], 1)
+        missing = self.client.get(
+            reverse('api:post_detail', kwargs={'post_id': 0}))
+        self.assertEqual(missing.status_code, 404)
+
+    def test_follow_feed_requires_login(self):
+        self.assertEqual(
+            self.client.get(reverse('api:follow_list')).status_code, 401)
+        reader = User.objects.create(username='Reader')
+        Follow.objects.create(user=reader, author=self.author)
+        client = Client()
+        client.force_login(reader)
+        data = client.get(reverse('api:follow_list')).json()
+        self.assertEqual(data['results'][0]['id'], self.post.pk)
@@ -0,0 +1,169 @@
+"""Версионированный JSON API только для чтения.
+
+Ленты берут те же запросы, что и страницы posts.views, но загружают
+лишь нужные колонки. ETag строится из поколения кэша лент, которое
+сдвигается при любом изменении постов, групп, комментариев и подписок,
+поэтому ответ 304 отдаётся без обращения к базе.
+"""
+import hashlib
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.http import urlencode
+from django.views.decorators.http import condition, require_GET
+
+from posts import timeline
+from posts.counters import get_counters
+from posts.feed_cache import get_generation
+from posts.models import Comment, Group, Post, User
+from posts.utils import CommentCursorPaginator, CursorPaginator
+from posts.views import feed
+
+POST_FIELDS = (
+    'text', 'pub_date', 'image', 'comments_count', 'views_count',
+    'author', 'author__username', 'group', 'group__slug',
+)
+COMMENT_FIELDS = ('text', 'created', 'post', 'author', 'author__username')
+
+
+def _etag(request, *args, **kwargs):
+    user_id = request.user.pk if request.user.is_authenticated else ''
+    raw = f'{get_generation()}:{user_id}:{request.get_full_path()}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def api_view(view):
+    view = condition(etag_func=_etag)(view)
+    return require_GET(view)
+
+
+def _response(data, status=200):
+    response = JsonResponse(
+        data, status=status, json_dumps_params={'ensure_ascii': False})
+    response['Vary'] = 'Cookie'
+    return response
+
+
+def _not_found():
+    return _response({'detail': 'Не найдено'}, status=404)
+
+
+def _link(request, name, cursor):
+    if cursor is None:
+        return None
+    return f'{request.path}?{urlencode({name: cursor})}'
+
+
+def _page(request, paginator, serialize):
+    page = paginator.get_page(
+        after=request.GET.get('after'), before=request.GET.get('before'))
+    return {
+        'results': [serialize(row) for row in page],
+        'next': _link(request, 'after', paginator.next_cursor),
+        'previous': _link(request, 'before', paginator.previous_cursor),
+    }
+
+
+def _post(post):
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'pub_date': post.pub_date,
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'image': post.image.url if post.image else None,
+        'comments_count': post.comments_count,
+        'views_count': post.views_count,
+    }
+
+
+def _comment(comment):
+    return {
+        'id': comment.pk,
+        'post': comment.post_id,
+        'author': comment.author.username,
+        'text': comment.text,
+        'created': comment.created,
+    }
+
+
+def _group(group):
+    return {
+        'slug': group.slug,
+        'title': group.title,
+        'description': group.description,
+        'posts_count': group.posts_count,
+    }
+
+
+def _posts_page(request, queryset):
+    paginator = CursorPaginator(
+        feed(queryset).only(*POST_FIELDS), settings.POST_LENGTH)
+    return _page(request, paginator, _post)
+
+
+@api_view
+def post_list(request):
+    return _response(_posts_page(request, Post.objects.all()))
+
+
+@api_view
+def post_detail(request, post_id):
+    post = feed(Post.objects.filter(pk=post_id)).only(*POST_FIELDS).first()
+    if post is None:
+        return _not_found()
+    return _response(_post(post))
+
+
+@api_view
+def comment_list(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        return _not_found()
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author').only(*COMMENT_FIELDS)
+    paginator = CommentCursorPaginator(comments, settings.POST_LENGTH)
+    return _response(_page(request, paginator, _comment))
+
+
+@api_view
+def follow_list(request):
+    if not request.user.is_authenticated:
+        return _response({'detail': 'Нужна авторизация'}, status=401)
+    paginator = timeline.HybridCursorPaginator(
+        timeline.HybridTimeline(request.user), settings.POST_LENGTH)
+    return _response(_page(request, paginator, _post))
+
+
+@api_view
+def group_list(request):
+    groups = Group.objects.order_by('title')
+    return _response({'results': [_group(group) for group in groups]})
+
+
+@api_view
+def group_detail(request, slug):
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        return _not_found()
+    data = {'group': _group(group)}
+    data.update(_posts_page(request, group.posts.all()))
+    return _response(data)
+
+
+@api_view
+def profile(request, username):
+    author = User.objects.filter(username=username).select_related(
+        'counters').only(
+            'username', 'first_name', 'last_name').first()
+    if author is None:
+        return _not_found()
+    counters = get_counters(author)
+    data = {'profile': {
+        'username': author.username,
+        'full_name': author.get_full_name(),
+        'posts_count': counters.posts_count,
+        'followers_count': counters.followers_count,
+        'following_count': counters.following_count,
+    }}
+    data.update(_posts_page(request, author.posts.all()))
+    return _response(data)
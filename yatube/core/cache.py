@@ -0,0 +1,300 @@
+"""Двухуровневый кэш: ограниченный LRU в процессе поверх общего бэкенда.
+
+Удаление ключа (delete, delete_many, clear) сдвигает штамп в общем кэше.
+Каждый воркер сверяет штамп один раз за запрос (и не реже CHECK_INTERVAL
+секунд вне запросов) и при расхождении очищает свой локальный уровень,
+поэтому инвалидация в одном воркере видна остальным уже на следующем
+запросе. Запись (set, add, incr) штамп не трогает: новые ключи, вроде
+фрагментов с поколением в имени, и так никем не закэшированы, а
+перезаписанное значение другие воркеры увидят не позже LOCAL_TIMEOUT.
+Если новое значение нужно всем сразу — сначала delete. Ключи, которые
+перезаписываются на месте (поколение лент, счётчики, page-modified:*),
+помечаются VOLATILE_PREFIXES: они минуют локальный уровень и хранятся
+в кэше COUNTERS (вместе со штампом), чтобы вытеснение фрагментов и
+страниц из общего кэша их не задевало. Остальные ключи либо новые
+(поколение в имени фрагментов и страниц), либо сбрасываются через
+delete (ключи миниатюр sorl).
+
+LockedFileBasedCache — файловый кэш, в котором add и incr атомарны
+между процессами одной машины: на них берётся flock. DurableFileBasedCache
+вдобавок при переполнении удаляет только истёкшие ключи.
+"""
+import fcntl
+import os
+import pickle
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.signals import request_started
+
+STAMP_KEY = 'two-level:stamp'
+
+_stores = {}
+_stores_lock = threading.Lock()
+_request_epoch = 0
+
+
+def _start_request(**kwargs):
+    global _request_epoch
+    _request_epoch += 1
+
+
+request_started.connect(_start_request)
+
+
+class _LocalStore:
+    def __init__(self):
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.epoch = None
+        self.checked = 0
+
+
+class TwoLevelCache(BaseCache):
+    """LOCATION — алиас общего кэша из settings.CACHES."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = location
+        self._counters_alias = options.get('COUNTERS', location)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self._check_interval = options.get('CHECK_INTERVAL', 1)
+        # Часто меняющиеся ключи (счётчики) минуют локальный уровень
+        # и не сбрасывают его у других воркеров.
+        self._volatile = tuple(options.get('VOLATILE_PREFIXES', ()))
+        with _stores_lock:
+            self._store = _stores.setdefault(location, _LocalStore())
+
+    @property
+    def _shared(self):
+        return caches[self._shared_alias]
+
+    @property
+    def _counters(self):
+        return caches[self._counters_alias]
+
+    def _is_volatile(self, key):
+        return key.startswith(self._volatile) if self._volatile else False
+
+    def _backend(self, key):
+        return self._counters if self._is_volatile(key) else self._shared
+
+    def _validate(self):
+        store = self._store
+        now = time.monotonic()
+        if (store.epoch == _request_epoch
+                and now - store.checked < self._check_interval):
+            return
+        stamp = self._counters.get(STAMP_KEY)
+        with store.lock:
+            if stamp != store.stamp:
+                store.data.clear()
+                store.stamp = stamp
+            store.epoch = _request_epoch
+            store.checked = now
+
+    def _bump(self):
+        previous = self._store.stamp
+        try:
+            stamp = self._counters.incr(STAMP_KEY)
+        except ValueError:
+            stamp = int(time.time() * 1000)
+            self._counters.set(STAMP_KEY, stamp, None)
+            return
+        if previous is not None and stamp == previous + 1:
+            # Между проверкой и записью писали только мы —
+            # свой ключ уже обновлён локально, сбрасывать L1 не нужно.
+            self._store.stamp = stamp
+
+    def _local_get(self, key):
+        store = self._store
+        with store.lock:
+            item = store.data.get(key)
+            if item is None:
+                return None
+            pickled, expires = item
+            if expires <= time.monotonic():
+                del store.data[key]
+                return None
+            store.data.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def _local_set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        ttl = self._local_timeout
+        if timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            self._local_delete(key)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        store = self._store
+        with store.lock:
+            store.data[key] = (pickled, time.monotonic() + ttl)
+            store.data.move_to_end(key)
+            while len(store.data) > self._max_entries:
+                store.data.popitem(last=False)
+
+    def _local_delete(self, key):
+        with self._store.lock:
+            self._store.data.pop(key, None)
+
+    def get(self, key, default=None, version=None):
+        if self._is_volatile(key):
+            return self._counters.get(key, default, version)
+        self._validate()
+        local_key = self.make_key(key, version)
+        value = self._local_get(local_key)
+        if value is not None:
+            return value
+        value = self._shared.get(key, version=version)
+        if value is None:
+            return default
+        self._local_set(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._validate()
+        found, missing, counters = {}, [], []
+        for key in keys:
+            if self._is_volatile(key):
+                counters.append(key)
+                continue
+            value = self._local_get(self.make_key(key, version))
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            fetched = self._shared.get_many(missing, version=version)
+            for key, value in fetched.items():
+                self._local_set(self.make_key(key, version), value)
+            found.update(fetched)
+        if counters:
+            found.update(self._counters.get_many(counters, version=version))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._backend(key).set(key, value, timeout, version)
+        if not self._is_volatile(key):
+            self._local_set(self.make_key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        shared = {key: value for key, value in data.items()
+                  if not self._is_volatile(key)}
+        counters = {key: value for key, value in data.items()
+                    if self._is_volatile(key)}
+        failed = []
+        if shared:
+            failed += self._shared.set_many(shared, timeout, version)
+        if counters:
+            failed += self._counters.set_many(counters, timeout, version)
+        for key, value in shared.items():
+            if key not in failed:
+                self._local_set(self.make_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._backend(key).add(key, value, timeout, version)
+        if added and not self._is_volatile(key):
+            self._local_set(self.make_key(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._backend(key).touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self._backend(key).incr(key, delta, version)
+        if not self._is_volatile(key):
+            self._local_delete(self.make_key(key, version))
+        return value
+
+    def delete(self, key, version=None):
+        self._backend(key).delete(key, version)
+        if not self._is_volatile(key):
+            self._bump()
+            self._local_delete(self.make_key(key, version))
+
+    def delete_many(self, keys, version=None):
+        counters = [key for key in keys if self._is_volatile(key)]
+        shared = [key for key in keys if not self._is_volatile(key)]
+        if counters:
+            self._counters.delete_many(counters, version)
+        if shared:
+            self._shared.delete_many(shared, version)
+            self._bump()
+            for key in shared:
+                self._local_delete(self.make_key(key, version))
+
+    def clear(self):
+        self._shared.clear()
+        if self._counters_alias != self._shared_alias:
+            self._counters.clear()
+        self._bump()
+        with self._store.lock:
+            self._store.data.clear()
+
+
+class LockedFileBasedCache(FileBasedCache):
+    """FileBasedCache с атомарными add и incr (get + set под flock)."""
+
+    @contextmanager
+    def _locked(self):
+        self._createdir()
+        with open(os.path.join(self._dir, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked():
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        # В отличие от BaseCache.incr сохраняет оставшееся время жизни.
+        with self._locked():
+            try:
+                with open(self._key_to_file(key, version), 'rb') as f:
+                    expiry = pickle.load(f)
+                    value = pickle.loads(zlib.decompress(f.read()))
+            except (FileNotFoundError, EOFError, zlib.error):
+                raise ValueError(f"Key '{key}' not found")
+            timeout = None
+            if expiry is not None:
+                timeout = expiry - time.time()
+                if timeout <= 0:
+                    raise ValueError(f"Key '{key}' not found")
+            value += delta
+            self.set(key, value, timeout, version)
+            return value
+
+
+class DurableFileBasedCache(LockedFileBasedCache):
+    """LockedFileBasedCache, который не теряет живые ключи.
+
+    При переполнении удаляются только истёкшие записи, а не случайная
+    треть, как в FileBasedCache: счётчики и корзины ограничения частоты
+    не должны пропадать из-за чужих ключей.
+    """
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        if len(filelist) < self._max_entries:
+            return
+        for fname in filelist:
+            try:
+                with open(fname, 'rb') as f:
+                    self._is_expired(f)
+            except FileNotFoundError:
+                pass
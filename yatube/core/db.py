@@ -0,0 +1,35 @@
+"""Профиль соединений SQLite.
+
+Каждое новое соединение получает PRAGMA из settings.SQLITE_PRAGMAS
+через сигнал connection_created. WAL разрешает читателям работать
+параллельно с писателем, busy_timeout заставляет писателя подождать
+блокировку вместо мгновенного «database is locked», synchronous=NORMAL
+в режиме WAL синхронизирует диск только на контрольных точках.
+Вместе с CONN_MAX_AGE соединение и его кэш страниц переживают запрос.
+"""
+from django.conf import settings
+
+# journal_mode переключается первым: остальные PRAGMA от него не зависят,
+# а смена режима требует отсутствия открытых транзакций.
+FIRST = ('journal_mode',)
+
+
+def pragma_statements(pragmas):
+    ordered = sorted(pragmas.items(), key=lambda item: item[0] not in FIRST)
+    return [f'PRAGMA {name} = {value}' for name, value in ordered]
+
+
+def apply_profile(db, pragmas):
+    """Применяет PRAGMA к соединению sqlite3."""
+    for statement in pragma_statements(pragmas):
+        db.execute(statement)
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    # Своя настройка у базы в DATABASES[...]['PRAGMAS'] важнее общей.
+    pragmas = connection.settings_dict.get(
+        'PRAGMAS', settings.SQLITE_PRAGMAS)
+    # Сырое соединение: служебные запросы не попадают в лог запросов.
+    apply_profile(connection.connection, pragmas)
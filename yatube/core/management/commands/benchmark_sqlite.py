@@ -0,0 +1,127 @@
+"""Нагрузочное сравнение профилей SQLite на временной базе.
+
+Читатели выбирают страницу постов автора, писатели добавляют посты —
+так же, как index/profile и post_create/add_comment. Сравниваются:
+  bare       — соединение на операцию без PRAGMA (было до профиля);
+  profile    — соединение на операцию с settings.SQLITE_PRAGMAS;
+  persistent — профиль и одно соединение на поток (CONN_MAX_AGE).
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import apply_profile
+
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, author_id INTEGER, '
+    'text TEXT, pub_date REAL)',
+    'CREATE INDEX post_author_pub_date ON post (author_id, pub_date)',
+)
+READ = ('SELECT id, text, pub_date FROM post WHERE author_id = ? '
+        'ORDER BY pub_date DESC LIMIT 10')
+WRITE = 'INSERT INTO post (author_id, text, pub_date) VALUES (?, ?, ?)'
+AUTHORS = 100
+
+
+def _prepare(path, rows):
+    db = sqlite3.connect(path)
+    for statement in SCHEMA:
+        db.execute(statement)
+    db.executemany(WRITE, (
+        (number % AUTHORS, f'пост {number}', time.time())
+        for number in range(rows)))
+    db.commit()
+    db.close()
+
+
+class _Worker(threading.Thread):
+    def __init__(self, path, pragmas, persistent, write, deadline):
+        super().__init__()
+        self.path = path
+        self.pragmas = pragmas
+        self.persistent = persistent
+        self.write = write
+        self.deadline = deadline
+        self.ops = self.errors = 0
+        self.random = random.Random()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path)
+        apply_profile(db, self.pragmas)
+        return db
+
+    def _operation(self, db):
+        author = self.random.randrange(AUTHORS)
+        if self.write:
+            with db:
+                db.execute(WRITE, (author, 'новый пост', time.time()))
+        else:
+            db.execute(READ, (author,)).fetchall()
+
+    def run(self):
+        db = self._connect() if self.persistent else None
+        while time.monotonic() < self.deadline:
+            current = db or self._connect()
+            try:
+                self._operation(current)
+                self.ops += 1
+            except sqlite3.OperationalError:
+                self.errors += 1
+            finally:
+                if not self.persistent:
+                    current.close()
+        if db is not None:
+            db.close()
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность SQLite без профиля и с ним'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--rows', type=int, default=20000)
+
+    def run_profile(self, pragmas, persistent, options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.sqlite3')
+            _prepare(path, options['rows'])
+            deadline = time.monotonic() + options['seconds']
+            workers = (
+                [_Worker(path, pragmas, persistent, False, deadline)
+                 for _ in range(options['readers'])]
+                + [_Worker(path, pragmas, persistent, True, deadline)
+                   for _ in range(options['writers'])])
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        result = {}
+        for kind, write in (('reads', False), ('writes', True)):
+            chosen = [worker for worker in workers if worker.write == write]
+            result[kind] = sum(worker.ops for worker in chosen)
+            result[f'{kind}_errors'] = sum(worker.errors for worker in chosen)
+        return result
+
+    def handle(self, *args, **options):
+        profiles = (
+            ('bare', {}, False),
+            ('profile', settings.SQLITE_PRAGMAS, False),
+            ('persistent', settings.SQLITE_PRAGMAS, True),
+        )
+        seconds = options['seconds']
+        self.stdout.write(
+            f'{"профиль":<12}{"чтений/с":>12}{"записей/с":>12}{"ошибок":>10}')
+        for name, pragmas, persistent in profiles:
+            result = self.run_profile(pragmas, persistent, options)
+            errors = result['reads_errors'] + result['writes_errors']
+            self.stdout.write(
+                f'{name:<12}{result["reads"] / seconds:>12.0f}'
+                f'{result["writes"] / seconds:>12.0f}{errors:>10}')
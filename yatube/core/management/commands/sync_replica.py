@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import replica
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файл реплики'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Скопировать один раз и выйти')
+        parser.add_argument(
+            '--interval', type=float, default=settings.REPLICA_SYNC_INTERVAL,
+            help='Пауза между копиями, секунд')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                started = time.monotonic()
+                target = replica.sync()
+                self.stdout.write(
+                    f'{target}: {time.monotonic() - started:.2f} с')
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
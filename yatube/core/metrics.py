@@ -0,0 +1,90 @@
+"""Простые счётчики в общем кэше, видимые всем воркерам.
+
+incr и observe только копят приращения в памяти процесса: запрос
+не ходит в кэш ради метрик. Буфер сбрасывается в кэш после ответа,
+если прошло METRICS_FLUSH_INTERVAL секунд, при выходе процесса и перед
+snapshot(), так что чужие воркеры видны с задержкой до интервала.
+"""
+import atexit
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+
+PREFIX = 'metrics:'
+
+_counters = {}
+_summaries = {}
+_gauges = {}
+
+_buffer = Counter()
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def register_counter(name, description):
+    _counters[name] = description
+
+
+def register_summary(name, description):
+    """Сводка из двух счётчиков: <name>_count и <name>_sum."""
+    _summaries[name] = description
+
+
+def register_gauge(name, description, func):
+    """Значение вычисляется функцией в момент снятия метрик."""
+    _gauges[name] = (description, func)
+
+
+def incr(name, value=1):
+    with _lock:
+        _buffer[name] += value
+
+
+def _store(name, value):
+    key = PREFIX + name
+    if cache.add(key, value, None):
+        return
+    try:
+        cache.incr(key, value)
+    except ValueError:
+        cache.set(key, value, None)
+
+
+def flush():
+    """Переносит накопленные приращения в общий кэш."""
+    global _buffer, _last_flush
+    with _lock:
+        pending, _buffer = _buffer, Counter()
+        _last_flush = time.monotonic()
+    for name, value in pending.items():
+        _store(name, value)
+
+
+def flush_if_due(**kwargs):
+    if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def observe(name, value):
+    incr(f'{name}_count')
+    incr(f'{name}_sum', value)
+
+
+def snapshot():
+    flush()
+    keys = list(_counters)
+    for name in _summaries:
+        keys += [f'{name}_count', f'{name}_sum']
+    values = cache.get_many([PREFIX + key for key in keys])
+    result = {key: values.get(PREFIX + key, 0) for key in keys}
+    for name, (description, func) in _gauges.items():
+        result[name] = func()
+    return result
+
+
+request_finished.connect(flush_if_due)
+atexit.register(flush)
@@ -0,0 +1,31 @@
+"""Paginator для админки, который не считает COUNT(*) по всей таблице."""
+from django.core.paginator import Paginator
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """Оценивает число строк вместо точного COUNT(*).
+
+    Без фильтров число строк — MAX(pk): это один спуск по первичному
+    ключу, и оценка никогда не меньше настоящего числа строк, так что
+    все записи остаются достижимыми. Отфильтрованный список считается
+    точно, пока в нём не больше count_limit строк; длиннее — та же
+    оценка MAX(pk) по всей таблице: она не меньше числа строк в любой
+    выборке из неё. Последние страницы в этом случае могут быть пустыми.
+    """
+    count_limit = 10000
+
+    def max_pk(self):
+        return self.object_list.model._default_manager.aggregate(
+            max_pk=Max('pk'))['max_pk'] or 0
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return self.max_pk()
+        count = queryset[:self.count_limit + 1].count()
+        if count <= self.count_limit:
+            return count
+        return max(count, self.max_pk())
@@ -0,0 +1,163 @@
+"""Ограничение частоты запросов: token bucket в кэше.
+
+Корзина хранит два ключа: момент start и счётчик потраченных жетонов
+used. Доступно (now - start) * rate - used жетонов. Оба ключа меняются
+только через add и incr/decr: start кладётся один раз и дальше лишь
+читается, жетон тратится incr, отказ возвращает его decr. Запас сверх
+ёмкости «сгорает» тем же incr used; чтобы два запроса не сожгли его
+дважды, это делает только взявший короткую блокировку на add. После
+простоя дольше времени полного наполнения ключи просто истекают.
+В базу ничего не пишется. Общий кэш должен выполнять add и incr
+атомарно (core.cache.LockedFileBasedCache, memcached, redis), а ключи
+PREFIX — быть в VOLATILE_PREFIXES, мимо локального уровня.
+
+Настройка — settings.RATE_LIMITS по имени URL:
+    'posts:post_create': {'user': '20/m', 'ip': '60/m'}
+Корзина user действует для авторизованных, ip — для всех запросов с
+адреса, в том числе авторизованных. Отказ одной корзины возвращает
+жетон, уже взятый из другой.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from . import metrics
+
+PREFIX = 'ratelimit:'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+DEFAULT_METHODS = ('POST',)
+
+metrics.register_counter('ratelimit_rejected', 'Отклонено запросов (429)')
+
+
+def parse_rate(rate):
+    """'20/m' → (20 жетонов ёмкости, жетонов в секунду)."""
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period]
+
+
+def _start(key, value, ttl):
+    """Момент start корзины: кладёт value, если корзины ещё нет."""
+    for _ in range(3):
+        if cache.add(key, value, ttl):
+            return value
+        start = cache.get(key)
+        if start is not None:
+            return start
+        # Ключ истёк между add и get — пробуем положить снова.
+    return value
+
+
+def _incr(key, delta, ttl):
+    for _ in range(3):
+        cache.add(key, 0, ttl)
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            # Ключ истёк между add и incr.
+            continue
+    return delta
+
+
+def consume(key, rate):
+    """Тратит жетон; возвращает 0 или сколько секунд ждать следующего."""
+    capacity, per_second = parse_rate(rate)
+    fill_time = capacity / per_second
+    ttl = math.ceil(fill_time) + 1
+    start_key, used_key = f'{PREFIX}{key}:start', f'{PREFIX}{key}:used'
+    now = time.time()
+
+    start = _start(start_key, now - fill_time, ttl)
+    used = _incr(used_key, 1, ttl)
+    allowance = (now - start) * per_second
+    if used > allowance:
+        release(key)
+        return (used - allowance) / per_second
+    excess = math.floor(allowance - (used - 1) - capacity)
+    lock_key = f'{PREFIX}{key}:lock'
+    if excess > 0 and cache.add(lock_key, 1, 1):
+        _incr(used_key, excess, ttl)
+        cache.delete(lock_key)
+    cache.touch(start_key, ttl)
+    cache.touch(used_key, ttl)
+    return 0
+
+
+def release(key):
+    """Возвращает в корзину жетон, взятый consume."""
+    try:
+        cache.decr(f'{PREFIX}{key}:used')
+    except ValueError:
+        pass
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check(request, scope, user=None, ip=None):
+    """Секунды до следующей попытки или 0, если запрос разрешён."""
+    buckets = []
+    if user and request.user.is_authenticated:
+        buckets.append((f'{scope}:user:{request.user.pk}', user))
+    if ip:
+        buckets.append((f'{scope}:ip:{client_ip(request)}', ip))
+    consumed = []
+    for key, rate in buckets:
+        retry_after = consume(key, rate)
+        if retry_after:
+            for taken in consumed:
+                release(taken)
+            return retry_after
+        consumed.append(key)
+    return 0
+
+
+def too_many_requests(retry_after):
+    metrics.incr('ratelimit_rejected')
+    response = HttpResponse(
+        'Слишком много запросов, попробуйте позже', status=429,
+        content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def ratelimit(scope, user=None, ip=None, methods=DEFAULT_METHODS):
+    """Декоратор для вью, не перечисленных в RATE_LIMITS."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                retry_after = check(request, scope, user, ip)
+                if retry_after:
+                    return too_many_requests(retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RateLimitMiddleware:
+    """Применяет settings.RATE_LIMITS к вью по имени URL."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name
+        limits = settings.RATE_LIMITS.get(view_name)
+        if not limits:
+            return None
+        if request.method not in limits.get('methods', DEFAULT_METHODS):
+            return None
+        retry_after = check(
+            request, view_name, limits.get('user'), limits.get('ip'))
+        if retry_after:
+            return too_many_requests(retry_after)
+        return None
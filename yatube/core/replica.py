@@ -0,0 +1,176 @@
+"""Чтение лент и карточек с реплики базы.
+
+ReplicaMiddleware разрешает чтение с реплики только GET/HEAD-запросам
+к вью из settings.REPLICA_VIEWS и к спискам админки. ReplicaRouter
+отправляет такие чтения на базу REPLICA_DATABASE, а любую запись —
+на основную; после первой записи запрос до конца читает с основной.
+Пользователь должен сразу видеть свой комментарий или пост, поэтому
+запрос с записью увеличивает счётчик записей WRITES_KEY и кладёт его
+новое значение в cookie: клиент читает с основной базы, пока sync
+не скопирует реплику со счётчиком не меньше этого (SYNCED_WRITES_KEY).
+REPLICA_PIN_SECONDS — лишь верхняя граница жизни cookie на случай,
+если синхронизация остановилась.
+
+Реплика — копия основного файла SQLite, которую команда sync_replica
+обновляет через online backup API. Перед копированием sync запоминает
+значение ключа кэша REPLICA_VERSION_KEY (поколение лент), а после —
+кладёт его в VERSION_KEY; так же переносится и счётчик записей.
+Пока поколение ушло вперёд, реплика может не содержать последних
+записей: такие запросы получают stale_marker(),
+который отделяет их фрагменты в кэше от фрагментов с основной базы,
+а целиком страницы с отстающей реплики не кэшируются вовсе.
+"""
+import os
+import sqlite3
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .db import apply_profile
+
+PIN_COOKIE = 'primary_pin'
+VERSION_KEY = 'replica:version'
+WRITES_KEY = 'replica:writes'
+SYNCED_WRITES_KEY = 'replica:synced-writes'
+
+_state = threading.local()
+
+
+def _replica_alias():
+    alias = settings.REPLICA_DATABASE
+    return alias if alias in settings.DATABASES else None
+
+
+def replica_available():
+    """Реплика настроена и уже получила хотя бы одну копию."""
+    alias = _replica_alias()
+    if alias is None:
+        return False
+    name = settings.DATABASES[alias]['NAME']
+    return os.path.isfile(name) and os.path.getsize(name) > 0
+
+
+def stale_marker():
+    """Метка снимка, если запрос читает с отстающей реплики, иначе ''."""
+    return getattr(_state, 'stale', '')
+
+
+def _stale_marker():
+    version = cache.get(VERSION_KEY)
+    if version is not None and version == cache.get(
+            settings.REPLICA_VERSION_KEY):
+        return ''
+    return f'replica{version}'
+
+
+def _count_write():
+    # Счётчик растёт уже после фиксации записи: sync, прочитавший
+    # новое значение, копирует базу вместе с ней.
+    if cache.add(WRITES_KEY, 1, None):
+        return 1
+    try:
+        return cache.incr(WRITES_KEY)
+    except ValueError:
+        cache.set(WRITES_KEY, 1, None)
+        return 1
+
+
+def _pinned(request):
+    """Реплика ещё не получила запись клиента из cookie."""
+    try:
+        written = int(request.COOKIES[PIN_COOKIE])
+    except (KeyError, ValueError):
+        return False
+    return (cache.get(SYNCED_WRITES_KEY) or 0) < written
+
+
+def is_replica_view(view_name):
+    if view_name in settings.REPLICA_VIEWS:
+        return True
+    return (view_name.startswith('admin:')
+            and view_name.endswith('_changelist'))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'use_replica', False):
+            return settings.REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        _state.use_replica = False
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — копия основной базы, объекты с обеих совместимы.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает на реплику вместе с копией файла.
+        return db != settings.REPLICA_DATABASE
+
+
+class ReplicaMiddleware:
+    """Включает чтение с реплики для подходящих запросов."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.use_replica = False
+        _state.wrote = False
+        _state.stale = ''
+        try:
+            response = self.get_response(request)
+            # Для кэша страниц снаружи: такой ответ хранить нельзя.
+            response.from_stale_replica = bool(_state.stale)
+            if _state.wrote:
+                response.set_cookie(
+                    PIN_COOKIE, str(_count_write()),
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True, samesite='Lax')
+            elif _state.use_replica and PIN_COOKIE in request.COOKIES:
+                # Реплика догнала запись клиента.
+                response.delete_cookie(PIN_COOKIE)
+            return response
+        finally:
+            _state.use_replica = False
+            _state.wrote = False
+            _state.stale = ''
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _state.use_replica = (
+            request.method in ('GET', 'HEAD')
+            and not _state.wrote
+            and is_replica_view(request.resolver_match.view_name)
+            and replica_available()
+            and not _pinned(request))
+        if _state.use_replica:
+            _state.stale = _stale_marker()
+
+
+def sync(source='default', target=None, pages=-1):
+    """Копирует основную базу в файл реплики; возвращает путь к нему.
+
+    backup пишет прямо в реплику под её блокировкой записи; в режиме WAL
+    читатели реплики в это время видят прежний снимок целиком.
+    """
+    target = target or settings.DATABASES[settings.REPLICA_DATABASE]['NAME']
+    connection = connections[source]
+    connection.ensure_connection()
+    # Запись фиксируется раньше, чем сдвигается поколение, поэтому всё,
+    # что отражено в прочитанном здесь поколении, уже попадёт в копию.
+    version = cache.get(settings.REPLICA_VERSION_KEY)
+    writes = cache.get(WRITES_KEY)
+    destination = sqlite3.connect(target)
+    try:
+        apply_profile(destination, settings.SQLITE_PRAGMAS)
+        connection.connection.backup(destination, pages=pages)
+    finally:
+        destination.close()
+    cache.set(VERSION_KEY, version, None)
+    cache.set(SYNCED_WRITES_KEY, writes, None)
+    return target
@@ -0,0 +1,158 @@
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.signals import request_started
+from django.test import SimpleTestCase, override_settings
+
+from core.cache import (
+    DurableFileBasedCache, LockedFileBasedCache, TwoLevelCache, _LocalStore,
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'test-shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-shared',
+    },
+    'test-counters': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-counters',
+    },
+}
+
+
+@override_settings(CACHES=CACHES)
+class TwoLevelCacheTests(SimpleTestCase):
+    def make_worker(self, **options):
+        worker = TwoLevelCache('test-shared', {'OPTIONS': options})
+        # У каждого «воркера» свой локальный уровень, как в отдельном процессе
+        worker._store = _LocalStore()
+        return worker
+
+    def tearDown(self):
+        self.make_worker().clear()
+
+    def test_invalidation_visible_to_other_worker_on_next_request(self):
+        """ Удаление в одном воркере видно другому со следующего запроса """
+        first, second = self.make_worker(), self.make_worker()
+        first.set('key', 1)
+        self.assertEqual(second.get('key'), 1)
+
+        first.delete('key')
+        first.set('key', 2)
+        request_started.send(sender=self.__class__)
+        self.assertEqual(second.get('key'), 2)
+
+        first.delete('key')
+        request_started.send(sender=self.__class__)
+        self.assertIsNone(second.get('key'))
+
+    def test_write_keeps_other_worker_local_level(self):
+        """ Запись нового ключа не сбрасывает локальный уровень соседей """
+        first, second = self.make_worker(), self.make_worker()
+        first.set('key', 1)
+        self.assertEqual(second.get('key'), 1)
+
+        first.set('other', 1)
+        first.add('added', 1)
+        request_started.send(sender=self.__class__)
+        self.assertEqual(len(second._store.data), 1)
+
+    def test_local_level_is_bounded(self):
+        worker = self.make_worker(MAX_ENTRIES=2)
+        for key in ('a', 'b', 'c'):
+            worker.set(key, key)
+        self.assertEqual(len(worker._store.data), 2)
+        self.assertEqual(worker.get('a'), 'a')
+
+    def test_volatile_keys_bypass_local_level(self):
+        worker = self.make_worker(VOLATILE_PREFIXES=['metrics:'])
+        worker.set('metrics:hits', 1)
+        worker.incr('metrics:hits')
+        self.assertEqual(worker.get('metrics:hits'), 2)
+        self.assertEqual(len(worker._store.data), 0)
+
+    def test_volatile_keys_live_in_counters_cache(self):
+        """ Счётчики хранятся отдельно и не вытесняются фрагментами """
+        worker = self.make_worker(
+            VOLATILE_PREFIXES=['ratelimit:'], COUNTERS='test-counters')
+        worker.set('ratelimit:bucket', 1)
+        worker.set('fragment', 1)
+        self.assertEqual(caches['test-counters'].get('ratelimit:bucket'), 1)
+        self.assertIsNone(caches['test-shared'].get('ratelimit:bucket'))
+        self.assertEqual(
+            worker.get_many(['ratelimit:bucket', 'fragment']),
+            {'ratelimit:bucket': 1, 'fragment': 1})
+        caches['test-shared'].clear()
+        self.assertEqual(worker.get('ratelimit:bucket'), 1)
+
+
+class LockedFileBasedCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def make_cache(self):
+        return LockedFileBasedCache(self.directory, {})
+
+    def run_threads(self, target, count=8):
+        threads = [threading.Thread(target=target) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_incr_is_atomic(self):
+        """ Параллельные incr не теряют приращений """
+        self.make_cache().set('counter', 0, None)
+
+        def increment():
+            cache = self.make_cache()
+            for _ in range(50):
+                cache.incr('counter')
+
+        self.run_threads(increment)
+        self.assertEqual(self.make_cache().get('counter'), 400)
+
+    def test_incr_keeps_timeout(self):
+        """ incr не продлевает и не сокращает время жизни ключа """
+        cache = self.make_cache()
+        cache.set('forever', 1, None)
+        cache.set('short', 1, 1)
+        cache.incr('forever')
+        cache.incr('short')
+        with mock.patch('time.time', return_value=time.time() + 400):
+            self.assertEqual(cache.get('forever'), 2)
+            self.assertIsNone(cache.get('short'))
+            with self.assertRaises(ValueError):
+                cache.incr('short')
+
+    def test_durable_cache_culls_only_expired_keys(self):
+        """ Переполненный DurableFileBasedCache не теряет живые ключи """
+        cache = DurableFileBasedCache(
+            self.directory, {'OPTIONS': {'MAX_ENTRIES': 3}})
+        cache.set('expired', 1, 1)
+        with mock.patch('time.time', return_value=time.time() - 10):
+            cache.set('stale', 1, 1)
+        for number in range(5):
+            cache.set(f'live{number}', number, None)
+        self.assertEqual(
+            cache.get_many([f'live{number}' for number in range(5)]),
+            {f'live{number}': number for number in range(5)})
+        self.assertEqual(len(cache._list_cache_files()), 6)
+
+    def test_add_succeeds_once(self):
+        """ Из параллельных add срабатывает ровно один """
+        results = []
+
+        def add():
+            results.append(self.make_cache().add('key', 1))
+
+        self.run_threads(add)
+        self.assertEqual(results.count(True), 1)
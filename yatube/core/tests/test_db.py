@@ -0,0 +1,36 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from core.db import pragma_statements
+
+
+class SqliteProfileTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_journal_mode_goes_first(self):
+        statements = pragma_statements(
+            {'synchronous': 'NORMAL', 'journal_mode': 'WAL'})
+        self.assertEqual(statements, [
+            'PRAGMA journal_mode = WAL', 'PRAGMA synchronous = NORMAL'])
+
+    def test_profile_applied_to_new_connections(self):
+        """ PRAGMA из SQLITE_PRAGMAS применены к соединению Django """
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('temp_store'), 2)
+        self.assertEqual(self.pragma('cache_size'), -64 * 1024)
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    def test_reports_every_profile(self):
+        out = StringIO()
+        call_command('benchmark_sqlite', readers=1, writers=1, seconds=0.2,
+                     rows=100, stdout=out)
+        names = [line.split()[0] for line in out.getvalue().splitlines()[1:]]
+        self.assertEqual(names, ['bare', 'profile', 'persistent'])
@@ -0,0 +1,31 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from core import metrics
+
+
+class MetricsBufferTests(TestCase):
+    def setUp(self):
+        metrics.flush()
+        cache.clear()
+        metrics.register_counter('test_hits', 'Тестовый счётчик')
+
+    def test_incr_stays_in_memory_until_flush(self):
+        """ Приращения копятся в процессе и не ходят в кэш на каждый вызов """
+        with mock.patch.object(metrics, '_store') as store:
+            metrics.incr('test_hits')
+            metrics.incr('test_hits', 2)
+        store.assert_not_called()
+        self.assertEqual(metrics.snapshot()['test_hits'], 3)
+        self.assertEqual(cache.get(metrics.PREFIX + 'test_hits'), 3)
+
+    @override_settings(METRICS_FLUSH_INTERVAL=3600)
+    def test_flush_after_request_waits_for_interval(self):
+        metrics.incr('test_hits')
+        metrics.flush_if_due()
+        self.assertIsNone(cache.get(metrics.PREFIX + 'test_hits'))
+        with override_settings(METRICS_FLUSH_INTERVAL=0):
+            metrics.flush_if_due()
+        self.assertEqual(cache.get(metrics.PREFIX + 'test_hits'), 1)
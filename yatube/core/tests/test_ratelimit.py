@@ -0,0 +1,100 @@
+import threading
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.ratelimit import consume
+from posts.models import Post
+
+User = get_user_model()
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bucket_allows_burst_then_refills(self):
+        """ Корзина пропускает ёмкость разом и пополняется со временем """
+        with mock.patch('core.ratelimit.time.time', return_value=1000.0):
+            self.assertEqual(
+                [consume('test', '3/m') for _ in range(3)], [0, 0, 0])
+            self.assertAlmostEqual(consume('test', '3/m'), 20)
+        with mock.patch('core.ratelimit.time.time', return_value=1020.0):
+            self.assertEqual(consume('test', '3/m'), 0)
+            self.assertGreater(consume('test', '3/m'), 0)
+
+    def test_idle_bucket_does_not_exceed_capacity(self):
+        with mock.patch('core.ratelimit.time.time', return_value=1000.0):
+            consume('test', '2/m')
+        with mock.patch('core.ratelimit.time.time', return_value=1050.0):
+            results = [consume('test', '2/m') for _ in range(3)]
+        self.assertEqual(results[:2], [0, 0])
+        self.assertGreater(results[2], 0)
+
+    def test_concurrent_requests_do_not_exceed_capacity(self):
+        """ Параллельные запросы не получают больше ёмкости корзины """
+        results = []
+
+        def spend():
+            for _ in range(5):
+                results.append(consume('test', '10/m'))
+
+        threads = [threading.Thread(target=spend) for _ in range(8)]
+        with mock.patch('core.ratelimit.time.time', return_value=1000.0):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results.count(0), 10)
+
+
+@override_settings(RATE_LIMITS={
+    'posts:add_comment': {'user': '2/m'},
+    'users:signup': {'ip': '1/m'},
+})
+class RateLimitMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_user_bucket_returns_429_with_retry_after(self):
+        user = User.objects.create(username='Author')
+        self.client.force_login(user)
+        post = Post.objects.create(text='пост', author=user)
+        url = reverse('posts:add_comment', kwargs={'post_id': post.pk})
+        statuses = [self.client.post(url).status_code for _ in range(2)]
+        self.assertEqual(statuses, [302, 302])
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        # GET не тратит жетоны.
+        self.assertNotEqual(self.client.get(url).status_code, 429)
+
+    def test_anonymous_requests_limited_by_ip(self):
+        url = reverse('users:signup')
+        self.client.post(url, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(
+            self.client.post(url, REMOTE_ADDR='10.0.0.1').status_code, 429)
+        self.assertNotEqual(
+            self.client.post(url, REMOTE_ADDR='10.0.0.2').status_code, 429)
+
+    @override_settings(RATE_LIMITS={
+        'posts:add_comment': {'user': '2/m', 'ip': '1/m'},
+    })
+    def test_authenticated_requests_limited_by_ip_too(self):
+        """ Авторизованные тоже тратят жетоны корзины адреса """
+        first = User.objects.create(username='First')
+        second = User.objects.create(username='Second')
+        post = Post.objects.create(text='пост', author=first)
+        url = reverse('posts:add_comment', kwargs={'post_id': post.pk})
+        self.client.force_login(first)
+        self.assertEqual(self.client.post(url).status_code, 302)
+        self.client.force_login(second)
+        self.assertEqual(self.client.post(url).status_code, 429)
+        # Отказ по адресу вернул жетон в корзину пользователя.
+        self.assertEqual(
+            self.client.post(url, REMOTE_ADDR='10.0.0.2').status_code, 302)
+        self.assertEqual(
+            self.client.post(url, REMOTE_ADDR='10.0.0.3').status_code, 302)
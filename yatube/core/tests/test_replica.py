@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import replica
+from posts.feed_cache import get_generation
+from posts.models import Post
+
+User = get_user_model()
+
+
+@mock.patch('core.replica.replica_available', lambda: True)
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Author')
+        self.post = Post.objects.create(text='пост', author=self.user)
+        self.detail = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk})
+
+    def get(self, url):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_listed_views_read_from_replica(self):
+        """ Лента и карточка поста читаются с реплики """
+        self.assertGreater(self.get(self.detail), 0)
+        self.assertGreater(self.get(reverse('posts:index')), 0)
+        self.assertEqual(self.get(reverse('posts:search')), 0)
+
+    def test_stale_replica_read_not_cached_for_writer(self):
+        """ Отстающая реплика не кладёт устаревшие страницы в общий кэш """
+        cache.set(replica.VERSION_KEY, get_generation(), None)
+        writer = self.client
+        writer.force_login(self.user)
+        writer.post(reverse('posts:post_create'), {'text': 'новый пост'})
+        post = Post.objects.latest('pk')
+        # Реплика ещё не получила пост: подменяем текст без сигналов.
+        Post.objects.filter(pk=post.pk).update(text='старый текст')
+        anonymous = self.client_class()
+        with CaptureQueriesContext(connections['replica']) as queries:
+            stale = anonymous.get(reverse('posts:index'))
+        self.assertTrue(queries)
+        self.assertContains(stale, 'старый текст')
+        self.assertIsNotNone(anonymous.get(reverse('posts:index')).context)
+        Post.objects.filter(pk=post.pk).update(text='новый пост')
+        self.assertContains(writer.get(reverse('posts:index')), 'новый пост')
+
+    def test_admin_changelist_reads_from_replica(self):
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        self.assertGreater(self.get(reverse('admin:posts_post_changelist')), 0)
+        self.assertEqual(self.get(reverse(
+            'admin:posts_post_change', args=[self.post.pk])), 0)
+
+    def test_write_pins_client_to_primary(self):
+        """ После записи клиент читает свои данные с основной базы """
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'комментарий'})
+        written = response.cookies[replica.PIN_COOKIE].value
+        self.assertEqual(self.get(self.detail), 0)
+
+        cache.set(replica.SYNCED_WRITES_KEY, int(written) - 1, None)
+        self.assertEqual(self.get(self.detail), 0)
+        cache.set(replica.SYNCED_WRITES_KEY, int(written), None)
+        self.assertGreater(self.get(self.detail), 0)
+        self.assertEqual(
+            self.client.cookies[replica.PIN_COOKIE].value, '')
+
+
+class ReplicaSyncTests(TransactionTestCase):
+    def test_sync_copies_primary(self):
+        User.objects.create(username='Author')
+        cache.set(replica.WRITES_KEY, 3, None)
+        with tempfile.TemporaryDirectory() as directory:
+            target = replica.sync(
+                target=os.path.join(directory, 'replica.sqlite3'))
+            self.assertEqual(
+                cache.get(replica.VERSION_KEY), get_generation())
+            self.assertEqual(cache.get(replica.SYNCED_WRITES_KEY), 3)
+            copy = sqlite3.connect(target)
+            try:
+                names = copy.execute(
+                    'SELECT username FROM auth_user').fetchall()
+            finally:
+                copy.close()
+        self.assertEqual(names, [('Author',)])
@@ -1,14 +1,74 @@
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db.models.expressions import RawSQL
+
+from core.paginator import EstimatedCountPaginator
 
 from .models import Group, Post, Comment, Follow
+from .search import to_match
+
+
+class LoadedAutocompleteSelect(AutocompleteSelect):
+    """Autocomplete, подпись которого берётся из уже загруженного объекта.
+
+    Обычный виджет делает запрос на каждую строку list_editable, чтобы
+    показать выбранное значение; здесь его даёт list_select_related.
+    """
+    selected = None
+
+    def optgroups(self, name, value, attr=None):
+        if self.selected is None or str(self.selected.pk) not in value:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        label = self.choices.field.label_from_instance(self.selected)
+        options.append(self.create_option(
+            name, self.selected.pk, label, True, len(options)))
+        return [(None, options, 0)]
 
 
 class PostAdmin(admin.ModelAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
     list_editable = ['group']
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
     empty_value_display = '-пусто-'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.get_autocomplete_fields(request):
+            kwargs['widget'] = LoadedAutocompleteSelect(
+                db_field.remote_field, self.admin_site,
+                using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_changelist_formset(self, request, **kwargs):
+        formset = super().get_changelist_formset(request, **kwargs)
+
+        class LoadedFormSet(formset):
+            def _construct_form(self, i, **kwargs):
+                form = super()._construct_form(i, **kwargs)
+                widget = form.fields['group'].widget
+                getattr(widget, 'widget', widget).selected = (
+                    form.instance.group)
+                return form
+
+        return LoadedFormSet
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идёт через полнотекстовый индекс, а не LIKE.
+        match = to_match(search_term)
+        if not match:
+            return queryset, False
+        post_ids = RawSQL(
+            'SELECT post_id FROM posts_search '
+            'WHERE posts_search MATCH %s AND rowid %% 2 = 0', [match])
+        return queryset.filter(pk__in=post_ids), False
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -19,14 +79,21 @@ class GroupAdmin(admin.ModelAdmin):
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = ('pk', 'post', 'author', 'text', 'created')
-    list_filter = ('author',)
-    search_fields = ('author', 'created')
+    list_select_related = ('post', 'author')
+    autocomplete_fields = ('post', 'author')
+    # Точное совпадение по username идёт по уникальному индексу.
+    search_fields = ('=author__username',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'author')
-    list_filter = ('author',)
-    search_fields = ('author', 'user')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    search_fields = ('=author__username', '=user__username')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(Post, PostAdmin)
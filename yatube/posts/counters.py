@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from . import timeline
+from .models import Comment, Follow, Group, Post, UserCounter
+from .utils import chunked
+
+User = get_user_model()
+
+RECOUNT_CHUNK_SIZE = 500
+
+
+def get_counters(user):
+    """Счётчики пользователя; для новых пользователей — нулевые."""
+    try:
+        return user.counters
+    except UserCounter.DoesNotExist:
+        return UserCounter(user=user)
+
+
+def _shift(field, delta):
+    # Счётчики не уходят в минус, даже если успели разойтись с данными.
+    return Greatest(F(field) + delta, 0)
+
+
+def bump_user(user_id, **deltas):
+    updates = {field: _shift(field, delta) for field, delta in deltas.items()}
+    if UserCounter.objects.filter(user_id=user_id).update(**updates):
+        return
+    if min(deltas.values()) > 0:
+        UserCounter.objects.get_or_create(user_id=user_id)
+        UserCounter.objects.filter(user_id=user_id).update(**updates)
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(pk=group_id).update(
+            posts_count=_shift('posts_count', delta))
+
+
+def bump_post(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=_shift('comments_count', delta))
+
+
+def _count(model, field, outer='pk'):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef(outer)}).order_by().values(
+            field).annotate(total=Count('pk')).values('total')[:1]), 0)
+
+
+def _recount_users(users, counters):
+    missing = users.filter(counters__isnull=True).values_list('pk', flat=True)
+    UserCounter.objects.bulk_create(
+        [UserCounter(user_id=pk) for pk in missing.iterator()],
+        batch_size=500, ignore_conflicts=True)
+    counters.update(
+        posts_count=_count(Post, 'author', 'user_id'),
+        followers_count=_count(Follow, 'author', 'user_id'),
+        following_count=_count(Follow, 'user', 'user_id'),
+    )
+
+
+def recount(user_ids=None, group_ids=None, post_ids=None):
+    """Пересчитывает счётчики по исходным таблицам.
+
+    Без аргументов — все; иначе только перечисленных пользователей,
+    групп и постов, кусками по RECOUNT_CHUNK_SIZE.
+    """
+    if user_ids is None and group_ids is None and post_ids is None:
+        _recount_users(User.objects.all(), UserCounter.objects.all())
+        Group.objects.update(posts_count=_count(Post, 'group'))
+        Post.objects.update(comments_count=_count(Comment, 'post'))
+        timeline.promote_heavy_authors()
+        return
+    for chunk in chunked(user_ids or (), RECOUNT_CHUNK_SIZE):
+        _recount_users(User.objects.filter(pk__in=chunk),
+                       UserCounter.objects.filter(user_id__in=chunk))
+        timeline.promote_heavy_authors(chunk)
+    for chunk in chunked(group_ids or (), RECOUNT_CHUNK_SIZE):
+        Group.objects.filter(pk__in=chunk).update(
+            posts_count=_count(Post, 'group'))
+    for chunk in chunked(post_ids or (), RECOUNT_CHUNK_SIZE):
+        Post.objects.filter(pk__in=chunk).update(
+            comments_count=_count(Comment, 'post'))
@@ -0,0 +1,103 @@
+"""Потоковая выгрузка данных пользователя.
+
+Строки читаются iterator(chunk_size) и сразу отдаются клиенту, поэтому
+память не растёт с числом постов. Формат строк совпадает с тем, что
+принимает import_content, так что архив можно загрузить обратно.
+"""
+import json
+import zipfile
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from .models import Comment, Follow, Post
+
+ZIP_BUFFER_SIZE = 64 * 1024
+
+
+def _rows(user, chunk_size):
+    posts = Post.objects.filter(author=user).order_by('pk').values(
+        'id', 'text', 'pub_date', 'image', group_slug=F('group__slug'))
+    for row in posts.iterator(chunk_size=chunk_size):
+        yield {
+            'type': 'post', 'id': row['id'], 'author': user.username,
+            'group': row['group_slug'], 'text': row['text'],
+            'pub_date': row['pub_date'], 'image': row['image'] or None,
+        }
+    comments = Comment.objects.filter(author=user).order_by('pk').values(
+        'id', 'post_id', 'text', 'created')
+    for row in comments.iterator(chunk_size=chunk_size):
+        yield {
+            'type': 'comment', 'id': row['id'], 'post': row['post_id'],
+            'author': user.username, 'text': row['text'],
+            'created': row['created'],
+        }
+    follows = Follow.objects.filter(user=user).order_by('pk').values_list(
+        'author__username', flat=True)
+    for author in follows.iterator(chunk_size=chunk_size):
+        yield {'type': 'follow', 'user': user.username, 'author': author}
+
+
+def export_lines(user, chunk_size=None):
+    """JSON Lines кусками по chunk_size строк."""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    rows = _rows(user, chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield ''.join(
+            json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+            for row in chunk)
+
+
+class _Buffer:
+    """Приёмник для zipfile без seek: байты забирает генератор архива."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks, self.size = [], 0
+        return data
+
+
+def export_zip(user, chunk_size=None):
+    """Zip с export.jsonl и картинками постов, отдаваемый по мере записи."""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open('export.jsonl', 'w', force_zip64=True) as entry:
+            for lines in export_lines(user, chunk_size):
+                entry.write(lines.encode())
+                if buffer.size >= ZIP_BUFFER_SIZE:
+                    yield buffer.drain()
+
+        images = Post.objects.filter(author=user).exclude(
+            image='').order_by('pk').values_list('image', flat=True)
+        for name in images.iterator(chunk_size=chunk_size):
+            try:
+                source = default_storage.open(name)
+            except OSError:
+                continue
+            # Картинки уже сжаты — кладём как есть.
+            info = zipfile.ZipInfo(f'images/{name}')
+            info.compress_type = zipfile.ZIP_STORED
+            with source, archive.open(info, 'w', force_zip64=True) as entry:
+                for block in source.chunks(ZIP_BUFFER_SIZE):
+                    entry.write(block)
+                    yield buffer.drain()
+    yield buffer.drain()
@@ -0,0 +1,45 @@
+"""Кэш фрагментов лент с поколением, которое сдвигают сигналы моделей."""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import replica
+
+GENERATION_KEY = 'feed:generation'
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # После вытеснения ключа начинаем с метки времени, а не с единицы,
+        # чтобы не совпасть с поколением старых фрагментов.
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        get_generation()
+
+
+def feed_cache(request, view, *scope):
+    """Параметры тега {% cache %}: время жизни и ключ ленты.
+
+    Ключ учитывает поколение, ленту, объект-фильтр и страницу/курсор,
+    а при чтении с отстающей реплики — ещё и метку её снимка, чтобы
+    устаревший фрагмент не достался читающим с основной базы.
+    """
+    page = [f'{param}={request.GET[param]}'
+            for param in PAGE_PARAMS if param in request.GET]
+    parts = [get_generation(), view, *scope, *page]
+    if replica.stale_marker():
+        parts.append(replica.stale_marker())
+    return {
+        'ttl': settings.FEED_CACHE_TTL,
+        'key': ':'.join(map(str, parts)),
+    }
@@ -0,0 +1,42 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import export_lines, export_zip
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты, комментарии и подписки пользователя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument(
+            '-o', '--output',
+            help='Куда писать; по умолчанию — стандартный вывод')
+        parser.add_argument(
+            '--zip', action='store_true',
+            help='Zip-архив с картинками вместо JSON Lines')
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help='Сколько строк читать из базы за раз')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'Нет пользователя {options["username"]}')
+
+        chunk_size = options['chunk_size']
+        if options['zip']:
+            chunks = export_zip(user, chunk_size)
+        else:
+            chunks = (lines.encode() for lines in
+                      export_lines(user, chunk_size))
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                output.writelines(chunks)
+        else:
+            sys.stdout.buffer.writelines(chunks)
@@ -0,0 +1,48 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.importer import TYPES, Importer, read_rows
+
+
+class Command(BaseCommand):
+    help = ('Импортирует посты, комментарии и подписки из JSON Lines '
+            'или CSV')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл .jsonl или .csv; «-» — стандартный ввод')
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'),
+            help='Формат файла, если его не видно по расширению')
+        parser.add_argument(
+            '--type', choices=TYPES,
+            help='Тип строк, у которых нет поля type')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.IMPORT_BATCH_SIZE,
+            help='Сколько строк вставлять одной транзакцией')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format_ = options['format'] or (
+            'csv' if path.endswith('.csv') else 'jsonl')
+        importer = Importer(
+            options['batch_size'], options['type'],
+            stdout=self.stdout if options['verbosity'] > 1 else None)
+        try:
+            if path == '-':
+                total, seconds = importer.run(read_rows(sys.stdin, format_))
+            else:
+                with open(path, encoding='utf-8', newline='') as stream:
+                    total, seconds = importer.run(read_rows(stream, format_))
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        for number, message in importer.errors:
+            self.stderr.write(f'строка {number}: {message}')
+        imported = sum(importer.imported.values())
+        rate = total / seconds if seconds else total
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано: {imported} из {total} строк '
+            f'за {seconds:.1f} с ({rate:.0f} строк/с)'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import generate_all, reset_memo
+
+
+class Command(BaseCommand):
+    help = 'Готовит миниатюры для всех картинок постов'
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').only('image')
+        done = 0
+        for post in posts.iterator():
+            for geometry_string, error in generate_all(post.image):
+                self.stderr.write(
+                    f'{post.image.name} {geometry_string}: {error}')
+            reset_memo()
+            done += 1
+        self.stdout.write(self.style.SUCCESS(f'Обработано картинок: {done}'))
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import feed_cache, ranking
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинг популярных постов по изменившимся постам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обновить рейтинг один раз и выйти')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.POPULAR_BATCH_SIZE)
+        parser.add_argument(
+            '--interval', type=float, default=settings.POPULAR_INTERVAL,
+            help='Пауза между пересчётами, секунд')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                rescored, pruned = ranking.refresh(options['batch_size'])
+                if rescored or pruned:
+                    feed_cache.bump_generation()
+                self.stdout.write(
+                    f'Пересчитано: {rescored}, удалено: {pruned}')
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
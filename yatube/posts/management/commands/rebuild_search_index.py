@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс постов и комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help='Сколько строк читать из базы за раз')
+
+    def handle(self, *args, **options):
+        total = search.rebuild(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано записей: {total}'))
@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пересобрать ленты только этих пользователей')
+
+    def handle(self, *args, **options):
+        usernames = options['usernames']
+        user_ids = None
+        if usernames:
+            user_ids = list(User.objects.filter(
+                username__in=usernames).values_list('pk', flat=True))
+            if len(user_ids) != len(set(usernames)):
+                raise CommandError('Не все пользователи найдены')
+        timeline.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS('Ленты пересобраны'))
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import suggestions
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рекомендации подписок по графу подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-k', type=int, default=settings.SUGGESTIONS_K,
+            help='Сколько рекомендаций хранить на пользователя')
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Число процессов для расчёта')
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.SUGGESTIONS_CHUNK_SIZE,
+            help='Пользователей в одном задании процесса')
+
+    def handle(self, *args, **options):
+        total, elapsed = suggestions.rebuild(
+            options['k'], options['processes'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендаций: {total} за {elapsed:.1f} с'))
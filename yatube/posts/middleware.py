@@ -0,0 +1,103 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, urlencode
+
+from . import view_counts
+from .feed_cache import PAGE_PARAMS, get_generation
+
+# Эти заголовки выставляются заново при каждой отдаче из кэша.
+SKIP_HEADERS = ('etag', 'last-modified', 'content-length')
+# Параметры, от которых зависит страница; прочие (метки рекламных
+# кампаний, случайные хвосты) не плодят отдельных ключей.
+KEY_PARAMS = (*PAGE_PARAMS, 'q')
+
+
+class AnonymousPageCacheMiddleware:
+    """Кэш целых страниц для читателей без сессии: ETag, Last-Modified, 304.
+
+    Ключ включает поколение лент, поэтому страницы сбрасываются теми же
+    сигналами, что и фрагменты. Ставится до сессий и аутентификации:
+    попадание в кэш не трогает ни их, ни ORM, ни шаблоны.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        match = self.resolve_cacheable(request)
+        if match is None:
+            return self.get_response(request)
+
+        url = self.get_url_hash(request)
+        key = f'page:{get_generation()}:{url}'
+        entry = cache.get(key)
+        if entry is None:
+            response = self.get_response(request)
+            if not self.is_cacheable_response(response):
+                return response
+            entry = self.make_entry(url, response)
+            cache.set(key, entry, settings.PAGE_CACHE_TTL)
+        else:
+            response = HttpResponse(entry['content'])
+            # Заголовки внутренних middleware (X-Frame-Options и др.)
+            # повторяются из сохранённого ответа.
+            for header, value in entry['headers']:
+                response[header] = value
+            # Вью не вызывается — просмотр засчитываем здесь.
+            if match.view_name == 'posts:post_detail':
+                view_counts.record(match.kwargs['post_id'])
+
+        response['ETag'] = entry['etag']
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        return get_conditional_response(
+            request, etag=entry['etag'],
+            last_modified=entry['last_modified'], response=response)
+
+    def resolve_cacheable(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        if settings.SESSION_COOKIE_NAME in request.COOKIES:
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if match.view_name not in settings.PAGE_CACHE_VIEWS:
+            return None
+        return match
+
+    def is_cacheable_response(self, response):
+        return (response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and not getattr(response, 'from_stale_replica', False))
+
+    def make_entry(self, url, response):
+        etag = '"%s"' % hashlib.md5(response.content).hexdigest()
+        # Новое поколение не значит новое содержимое: Last-Modified
+        # сдвигается, только когда страница действительно изменилась.
+        modified_key = f'page-modified:{url}'
+        modified = cache.get(modified_key)
+        if modified is None or modified['etag'] != etag:
+            modified = {'etag': etag, 'last_modified': int(time.time())}
+            cache.set(modified_key, modified, settings.PAGE_MODIFIED_TTL)
+        return {
+            'content': response.content,
+            'headers': [(header, value) for header, value in response.items()
+                        if header.lower() not in SKIP_HEADERS],
+            'etag': etag,
+            'last_modified': modified['last_modified'],
+        }
+
+    def get_url_hash(self, request):
+        # Вью читают параметры через GET.get(), то есть последнее значение.
+        query = urlencode([(param, request.GET[param])
+                           for param in KEY_PARAMS if param in request.GET])
+        return hashlib.md5(
+            f'{request.path_info}?{query}'.encode()).hexdigest()
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+CREATE = """
+CREATE VIRTUAL TABLE posts_search USING fts5(
+    text,
+    post_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+FILL = """
+INSERT INTO posts_search (rowid, text, post_id)
+SELECT id * 2, text, id FROM posts_post
+UNION ALL
+SELECT id * 2 + 1, text, post_id FROM posts_comment
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            [CREATE, FILL],
+            reverse_sql='DROP TABLE posts_search',
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_views_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='posts.Post')),
+                ('pub_date', models.DateTimeField()),
+                ('comments', models.PositiveIntegerField(verbose_name='Комментариев')),
+                ('views', models.PositiveIntegerField(verbose_name='Просмотров')),
+                ('follows', models.PositiveIntegerField(verbose_name='Новых подписчиков автора')),
+                ('score', models.FloatField(db_index=True, verbose_name='Рейтинг')),
+                ('computed_at', models.DateTimeField(verbose_name='Пересчитан')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг поста',
+                'verbose_name_plural': 'Рейтинги постов',
+            },
+        ),
+        migrations.AddField(
+            model_name='follow',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, null=True, verbose_name='Дата подписки'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_heavy_authors(apps, schema_editor):
+    UserCounter = apps.get_model('posts', 'UserCounter')
+    UserCounter.objects.filter(
+        followers_count__gt=settings.TIMELINE_FANOUT_THRESHOLD,
+    ).update(pull_timeline=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_follow_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercounter',
+            name='pull_timeline',
+            field=models.BooleanField(default=False, verbose_name='Лента читается на лету'),
+        ),
+        migrations.RunPython(mark_heavy_authors, migrations.RunPython.noop),
+    ]
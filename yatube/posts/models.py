@@ -4,11 +4,36 @@ from django.db import models
 User = get_user_model()
 
 
-class Group(models.Model):
+class CountersModel(models.Model):
+    """Модель со счётчиками, которые меняются только UPDATE … F().
+
+    Обычный save() уже существующей строки (форма, list_editable в
+    админке) не перезаписывает счётчики значениями из устаревшего
+    экземпляра.
+    """
+    counter_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields]
+        super().save(*args, **kwargs)
+
+
+class Group(CountersModel):
     title = models.CharField(max_length=200, verbose_name='Заголовок')
     slug = models.SlugField(unique=True, max_length=250,
                             verbose_name='Тег', null=True, blank=True)
     description = models.TextField(verbose_name='Описание')
+    posts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Постов')
+
+    counter_fields = ('posts_count',)
 
     class Meta:
         verbose_name = 'Группа'
@@ -18,7 +43,7 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class Post(CountersModel):
     text = models.TextField(verbose_name='Пост')
     pub_date = models.DateTimeField(auto_now_add=True, db_index=True)
     author = models.ForeignKey(
@@ -35,10 +60,23 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Комментариев')
+    # Пишется пачками из буфера posts.view_counts.
+    views_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Просмотров')
+
+    counter_fields = ('comments_count', 'views_count')
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -71,6 +109,10 @@ class Comment(models.Model):
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -78,6 +120,9 @@ class Follow(models.Model):
                              related_name="follower")
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name="following")
+    # У подписок, созданных до появления поля, даты нет.
+    created = models.DateTimeField(auto_now_add=True, null=True,
+                                   verbose_name='Дата подписки')
 
     class Meta:
         constraints = [
@@ -86,3 +131,98 @@ class Follow(models.Model):
                 name='unique_subscriber'
             )
         ]
+        indexes = [
+            models.Index(fields=['user', 'author'],
+                         name='follow_user_author_idx'),
+            # Списки подписчиков и подписок листаются по id.
+            models.Index(fields=['author', '-id'],
+                         name='follow_author_id_idx'),
+            models.Index(fields=['user', '-id'],
+                         name='follow_user_id_idx'),
+        ]
+
+
+class UserCounter(models.Model):
+    """Поддерживаемые счётчики пользователя вместо COUNT(*) на рендер."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name='counters')
+    posts_count = models.PositiveIntegerField(default=0,
+                                              verbose_name='Постов')
+    followers_count = models.PositiveIntegerField(default=0,
+                                                  verbose_name='Подписчиков')
+    following_count = models.PositiveIntegerField(default=0,
+                                                  verbose_name='Подписок')
+    # Посты автора читаются в ленты на лету
+    # (см. timeline.promote_heavy_authors).
+    pull_timeline = models.BooleanField(
+        default=False, verbose_name='Лента читается на лету')
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: строка на пару (читатель, пост)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='+')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+
+class PostScore(models.Model):
+    """Рейтинг недавнего поста для вкладки «Популярное»."""
+    post = models.OneToOneField(Post, on_delete=models.CASCADE,
+                                primary_key=True, related_name='score')
+    pub_date = models.DateTimeField()
+    comments = models.PositiveIntegerField(verbose_name='Комментариев')
+    views = models.PositiveIntegerField(verbose_name='Просмотров')
+    follows = models.PositiveIntegerField(
+        verbose_name='Новых подписчиков автора')
+    score = models.FloatField(db_index=True, verbose_name='Рейтинг')
+    computed_at = models.DateTimeField(verbose_name='Пересчитан')
+
+    class Meta:
+        verbose_name = 'Рейтинг поста'
+        verbose_name_plural = 'Рейтинги постов'
+
+
+class FollowSuggestion(models.Model):
+    """Рекомендация автора: на него подписаны те, на кого подписан user."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='suggestions')
+    suggested = models.ForeignKey(User, on_delete=models.CASCADE,
+                                  related_name='+',
+                                  verbose_name='Рекомендуемый автор')
+    mutual = models.PositiveIntegerField(verbose_name='Общих подписок')
+
+    class Meta:
+        verbose_name = 'Рекомендация подписки'
+        verbose_name_plural = 'Рекомендации подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'suggested'],
+                name='unique_follow_suggestion'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-mutual'],
+                         name='suggestion_user_mutual_idx'),
+        ]
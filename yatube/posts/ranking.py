@@ -0,0 +1,121 @@
+"""Рейтинг популярных постов для вкладки «Популярное».
+
+Вес поста — взвешенная сумма комментариев, просмотров и подписчиков,
+которых автор набрал после публикации; вес затухает вдвое каждые
+POPULAR_HALF_LIFE. Затухание в любой момент одинаково для всех постов,
+поэтому в PostScore хранится не зависящий от времени ключ
+log2(1 + вес) + возраст эпохи / период полураспада: порядок по нему
+совпадает с порядком по затухающему весу. Благодаря этому refresh()
+пересчитывает только посты, которых коснулись с прошлого запуска,
+а строки остальных остаются верными. Посты старше POPULAR_WINDOW
+из рейтинга удаляются.
+"""
+import math
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core import metrics
+
+from .models import Follow, Post, PostScore
+
+LAST_RUN_KEY = 'popular:last_run'
+
+metrics.register_counter('popular_rescored', 'Постов пересчитано в рейтинге')
+
+
+def weight(comments, views, follows):
+    weights = settings.POPULAR_WEIGHTS
+    return (comments * weights['comments'] + views * weights['views']
+            + follows * weights['follows'])
+
+
+def score(pub_date, comments, views, follows):
+    half_life = settings.POPULAR_HALF_LIFE.total_seconds()
+    return (math.log2(1 + weight(comments, views, follows))
+            + pub_date.timestamp() / half_life)
+
+
+def _touched(since, window_start):
+    """id недавних постов, у которых могли измениться очки."""
+    recent = Post.objects.filter(pub_date__gte=window_start)
+    if since is None:
+        return recent.values_list('pk', flat=True)
+    # Счётчики поста сравниваются с учтёнными в прошлый раз,
+    # а подписки без даты создания пересчёт не запускают.
+    changed = (Q(score__isnull=True)
+               | ~Q(comments_count=F('score__comments'))
+               | ~Q(views_count=F('score__views'))
+               | Q(author_id__in=Follow.objects.filter(
+                   created__gte=since).values('author_id')))
+    return recent.filter(changed).values_list('pk', flat=True)
+
+
+def _follows_gained(posts, window_start):
+    """Подписчики, пришедшие к автору после публикации каждого поста."""
+    dates = defaultdict(list)
+    follows = Follow.objects.filter(
+        author_id__in={post.author_id for post in posts},
+        created__gte=window_start,
+    ).order_by('created').values_list('author_id', 'created')
+    for author_id, created in follows:
+        dates[author_id].append(created)
+    return {
+        post.pk: len(dates[post.author_id])
+        - bisect_left(dates[post.author_id], post.pub_date)
+        for post in posts
+    }
+
+
+def _rescore(post_ids, window_start, now):
+    posts = list(Post.objects.filter(pk__in=post_ids).only(
+        'pk', 'author_id', 'pub_date', 'comments_count', 'views_count'))
+    follows = _follows_gained(posts, window_start)
+    rows = [
+        PostScore(
+            post_id=post.pk, pub_date=post.pub_date,
+            comments=post.comments_count, views=post.views_count,
+            follows=follows[post.pk],
+            score=score(post.pub_date, post.comments_count,
+                        post.views_count, follows[post.pk]),
+            computed_at=now,
+        )
+        for post in posts
+    ]
+    with transaction.atomic():
+        PostScore.objects.filter(post_id__in=post_ids).delete()
+        PostScore.objects.bulk_create(rows)
+    return len(rows)
+
+
+def refresh(batch_size=None):
+    """Обновляет рейтинг; возвращает (пересчитано, удалено) строк.
+
+    Без отметки прошлого запуска в кэше пересчитывается всё окно.
+    """
+    batch_size = batch_size or settings.POPULAR_BATCH_SIZE
+    now = timezone.now()
+    window_start = now - settings.POPULAR_WINDOW
+    since = cache.get(LAST_RUN_KEY)
+    pruned, _ = PostScore.objects.filter(pub_date__lt=window_start).delete()
+    touched = list(_touched(since, window_start))
+    rescored = 0
+    for start in range(0, len(touched), batch_size):
+        rescored += _rescore(
+            touched[start:start + batch_size], window_start, now)
+    cache.set(LAST_RUN_KEY, now, None)
+    metrics.incr('popular_rescored', rescored)
+    return rescored, pruned
+
+
+def top(limit=None):
+    """Посты рейтинга по убыванию очков — одним запросом."""
+    window_start = timezone.now() - settings.POPULAR_WINDOW
+    rows = PostScore.objects.filter(pub_date__gte=window_start).select_related(
+        'post__author', 'post__group').order_by('-score', '-post_id')
+    return [row.post for row in rows[:limit or settings.POPULAR_SIZE]]
@@ -0,0 +1,254 @@
+"""Полнотекстовый поиск по постам и комментариям на SQLite FTS5.
+
+Индекс posts_search хранит текст поста под rowid = 2 * id и текст
+комментария под rowid = 2 * id + 1; в колонке post_id — пост, на который
+ведёт результат. Индекс обновляется сигналами, массовые изменения
+в обход save() досчитывает команда rebuild_search_index; строки индекса
+без поста или комментария отбрасываются в самом запросе, до LIMIT.
+
+Курсор страницы — (rank, rowid). bm25 зависит от статистики всего
+индекса, поэтому, если между страницами индекс изменился, результат
+на стыке страниц может повториться или пропасть. Для поиска это
+допустимо; порядок внутри одного запроса всегда согласован.
+"""
+import base64
+import binascii
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Comment, Post
+from .utils import CursorPaginator, chunked
+
+TABLE = 'posts_search'
+POSTS = Post._meta.db_table
+COMMENTS = Comment._meta.db_table
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 24
+
+
+def post_rowid(pk):
+    return pk * 2
+
+
+def comment_rowid(pk):
+    return pk * 2 + 1
+
+
+def _replace(rowid, text, post_id):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [rowid])
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, text, post_id) VALUES (%s, %s, %s)',
+            [rowid, text, post_id])
+
+
+def _delete(rowid):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [rowid])
+
+
+def index_post(post):
+    _replace(post_rowid(post.pk), post.text, post.pk)
+
+
+def index_comment(comment):
+    _replace(comment_rowid(comment.pk), comment.text, comment.post_id)
+
+
+def remove_post(pk):
+    _delete(post_rowid(pk))
+
+
+def remove_comment(pk):
+    _delete(comment_rowid(pk))
+
+
+def _rows(queryset, rowid, chunk_size):
+    for pk, text, post_id in queryset.iterator(chunk_size=chunk_size):
+        yield rowid(pk), text, post_id
+
+
+def rebuild(chunk_size=None):
+    """Перестраивает индекс, читая таблицы кусками по chunk_size строк."""
+    chunk_size = chunk_size or settings.SEARCH_CHUNK_SIZE
+    sources = [
+        (Post.objects.values_list('pk', 'text', 'pk'), post_rowid),
+        (Comment.objects.values_list('pk', 'text', 'post_id'), comment_rowid),
+    ]
+    total = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        for queryset, rowid in sources:
+            batch = []
+            for row in _rows(queryset, rowid, chunk_size):
+                batch.append(row)
+                if len(batch) >= chunk_size:
+                    total += _insert(cursor, batch)
+                    batch = []
+            total += _insert(cursor, batch)
+        cursor.execute(
+            f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return total
+
+
+def reindex(post_ids=(), comment_ids=(), chunk_size=None):
+    """Переиндексирует выбранные посты и комментарии.
+
+    Каждый кусок из chunk_size строк — в своей короткой транзакции,
+    чтобы не держать блокировку записи на всё время переиндексации.
+    """
+    chunk_size = chunk_size or settings.SEARCH_CHUNK_SIZE
+    sources = [
+        (post_ids, Post.objects.values_list('pk', 'text', 'pk'),
+         post_rowid),
+        (comment_ids, Comment.objects.values_list('pk', 'text', 'post_id'),
+         comment_rowid),
+    ]
+    total = 0
+    for ids, queryset, rowid in sources:
+        for chunk in chunked(ids, chunk_size):
+            batch = [(rowid(pk), text, post_id) for pk, text, post_id
+                     in queryset.filter(pk__in=chunk)]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {TABLE} WHERE rowid IN '
+                    f'({", ".join(["%s"] * len(chunk))})',
+                    [rowid(pk) for pk in chunk])
+                total += _insert(cursor, batch)
+    return total
+
+
+def _insert(cursor, batch):
+    if batch:
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, text, post_id) VALUES (%s, %s, %s)',
+            batch)
+    return len(batch)
+
+
+def to_match(query):
+    """Превращает ввод пользователя в безопасное выражение MATCH.
+
+    Каждое слово — отдельная фраза с поиском по префиксу, слова
+    объединяются через AND; операторы FTS5 из ввода не проходят.
+    """
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def highlight(snippet):
+    """Экранирует фрагмент и оборачивает совпадения в <mark>."""
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>'))
+
+
+class Hit:
+    """Найденный пост или комментарий с подсвеченным фрагментом."""
+
+    def __init__(self, rowid, rank, post_id, snippet):
+        self.rowid = rowid
+        self.rank = rank
+        self.post_id = post_id
+        self.snippet = highlight(snippet)
+        self.post = None
+        self.comment = None
+
+    @property
+    def is_comment(self):
+        return self.rowid % 2 == 1
+
+
+class Search:
+    """Результаты поиска по возрастанию rank (bm25), затем по rowid."""
+
+    def __init__(self, query):
+        self.query = query
+        self.match = to_match(query)
+
+    def __bool__(self):
+        return bool(self.match)
+
+    def _fetch(self, cursor, limit, newer=False):
+        if not self.match:
+            return []
+        sql = (
+            'SELECT rowid, rank, post_id, snippet('
+            f"{TABLE}, 0, %s, %s, '…', {SNIPPET_TOKENS}) "
+            f'FROM {TABLE} WHERE {TABLE} MATCH %s '
+            f'AND EXISTS (SELECT 1 FROM {POSTS} '
+            f'WHERE {POSTS}.id = {TABLE}.post_id) '
+            f'AND ({TABLE}.rowid % 2 = 0 OR EXISTS (SELECT 1 FROM {COMMENTS} '
+            f'WHERE {COMMENTS}.id = {TABLE}.rowid / 2))'
+        )
+        params = [MARK_START, MARK_END, self.match]
+        if cursor is not None:
+            op = '<' if newer else '>'
+            sql = (f'SELECT * FROM ({sql}) WHERE rank {op} %s '
+                   f'OR (rank = %s AND rowid {op} %s)')
+            params += [cursor[0], cursor[0], cursor[1]]
+        direction = 'DESC' if newer else 'ASC'
+        sql += f' ORDER BY rank {direction}, rowid {direction} LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(sql, params)
+            hits = [Hit(*row) for row in db_cursor.fetchall()]
+        return self._attach(hits)
+
+    def _attach(self, hits):
+        post_ids = {hit.post_id for hit in hits}
+        comment_ids = {hit.rowid // 2 for hit in hits if hit.is_comment}
+        posts = Post.objects.select_related(
+            'author', 'group').in_bulk(post_ids)
+        comments = Comment.objects.select_related(
+            'author').in_bulk(comment_ids)
+        attached = []
+        for hit in hits:
+            hit.post = posts.get(hit.post_id)
+            if hit.is_comment:
+                hit.comment = comments.get(hit.rowid // 2)
+                if hit.comment is None:
+                    continue
+            if hit.post is not None:
+                attached.append(hit)
+        return attached
+
+    def older(self, cursor, limit):
+        return self._fetch(cursor, limit)
+
+    def newer(self, cursor, limit):
+        return self._fetch(cursor, limit, newer=True)
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсор — пара (rank, rowid) последнего результата страницы.
+
+    rank пересчитывается при каждом запросе: см. оговорку в начале модуля.
+    """
+
+    def _order(self, object_list):
+        return object_list
+
+    def _cursor(self, row):
+        raw = f'{row.rank!r}|{row.rowid}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def _decode(self, token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            rank, rowid = raw.rsplit('|', 1)
+            return float(rank), int(rowid)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise ValueError('Некорректный курсор')
+
+    def _fetch_older(self, cursor, limit):
+        return self.object_list.older(cursor, limit)
+
+    def _fetch_newer(self, cursor, limit):
+        return self.object_list.newer(cursor, limit)
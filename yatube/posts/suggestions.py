@@ -0,0 +1,177 @@
+"""Рекомендации подписок: авторы, на которых подписаны ваши авторы.
+
+Граф подписок читается в два массива целых (CSR): offsets[i] — начало
+списка авторов пользователя с индексом i в targets. Индексы плотные,
+id пользователя по индексу хранится в ids. Для каждого пользователя
+считаются авторы его авторов, кроме уже читаемых и его самого, и
+сохраняются SUGGESTIONS_K лучших по числу общих подписок.
+
+Пересчёт целиком выполняет команда suggest_follows. Пользователи
+делятся на куски, которые можно считать в нескольких процессах:
+дочерние процессы получают граф через fork и в базу не ходят. Строки
+заменяются уже после расчёта, по транзакции на кусок пользователей.
+"""
+import heapq
+import multiprocessing
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .models import Follow, FollowSuggestion
+
+User = get_user_model()
+
+_graph = None
+
+
+class Graph:
+    """Подписки в виде плотных целочисленных массивов."""
+
+    def __init__(self, ids, offsets, targets):
+        self.ids = ids
+        self.offsets = offsets
+        self.targets = targets
+
+    def __len__(self):
+        return len(self.ids)
+
+    def following(self, index):
+        return self.targets[self.offsets[index]:self.offsets[index + 1]]
+
+
+def _index(ids, pk):
+    index = bisect_left(ids, pk)
+    if index < len(ids) and ids[index] == pk:
+        return index
+    return None
+
+
+def load_graph(chunk_size=None):
+    chunk_size = chunk_size or settings.SUGGESTIONS_CHUNK_SIZE
+    ids = array('q', User.objects.order_by('pk').values_list(
+        'pk', flat=True).iterator(chunk_size=chunk_size))
+    offsets = array('q', [0]) * (len(ids) + 1)
+    targets = array('q')
+    follows = Follow.objects.order_by('user_id', 'author_id').values_list(
+        'user_id', 'author_id')
+    for user_id, author_id in follows.iterator(chunk_size=chunk_size):
+        user, author = _index(ids, user_id), _index(ids, author_id)
+        # Пользователи, появившиеся после чтения ids, ждут следующего раза.
+        if user is not None and author is not None:
+            offsets[user + 1] += 1
+            targets.append(author)
+    for index in range(len(ids)):
+        offsets[index + 1] += offsets[index]
+    return Graph(ids, offsets, targets)
+
+
+def suggest(graph, index, k):
+    """k лучших кандидатов для пользователя: [(индекс, общих подписок)]."""
+    following = graph.following(index)
+    counts = Counter()
+    for author in following:
+        counts.update(graph.following(author))
+    counts.pop(index, None)
+    for author in following:
+        counts.pop(author, None)
+    # При равенстве выше тот, кто раньше зарегистрировался.
+    return heapq.nlargest(
+        k, counts.items(), key=lambda item: (item[1], -item[0]))
+
+
+def _compute(task):
+    start, stop, k = task
+    rows = []
+    for index in range(start, stop):
+        user_id = _graph.ids[index]
+        for candidate, mutual in suggest(_graph, index, k):
+            rows.append((user_id, _graph.ids[candidate], mutual))
+    return start, rows
+
+
+def _chunks(graph, chunk_size, k):
+    for start in range(0, len(graph), chunk_size):
+        yield start, min(start + chunk_size, len(graph)), k
+
+
+def compute(graph, k, processes=1, chunk_size=None):
+    """Рекомендации всех пользователей кусками по chunk_size.
+
+    Выдаёт пары (индекс первого пользователя куска, строки куска).
+    """
+    global _graph
+    chunk_size = chunk_size or settings.SUGGESTIONS_CHUNK_SIZE
+    _graph = graph
+    tasks = _chunks(graph, chunk_size, k)
+    try:
+        if processes <= 1:
+            yield from map(_compute, tasks)
+            return
+        context = multiprocessing.get_context('fork')
+        with context.Pool(processes) as pool:
+            yield from pool.imap_unordered(_compute, tasks)
+    finally:
+        _graph = None
+
+
+def _replace(queryset, columns):
+    batch = settings.SUGGESTIONS_CHUNK_SIZE
+    with transaction.atomic():
+        queryset.delete()
+        for start in range(0, len(columns[0]), batch):
+            FollowSuggestion.objects.bulk_create(
+                [FollowSuggestion(user_id=user_id, suggested_id=suggested_id,
+                                  mutual=mutual)
+                 for user_id, suggested_id, mutual in zip(
+                     *(column[start:start + batch] for column in columns))])
+
+
+def rebuild(k=None, processes=1, chunk_size=None):
+    """Пересчитывает все рекомендации; возвращает (строк, секунд).
+
+    Сначала всё считается вне транзакции (и дочерние процессы
+    запускаются без открытой транзакции), затем строки каждого куска
+    пользователей заменяются в своей транзакции: блокировка записи
+    держится на один кусок, а не на всю таблицу.
+    """
+    k = k or settings.SUGGESTIONS_K
+    started = time.monotonic()
+    graph = load_graph(chunk_size)
+    chunks = {}
+    total = 0
+    for start, rows in compute(graph, k, processes, chunk_size):
+        columns = (array('q'), array('q'), array('q'))
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+        chunks[start] = columns
+        total += len(rows)
+    starts = sorted(chunks)
+    for position, start in enumerate(starts):
+        # Куски покрывают все id подряд: строки пользователей вне графа
+        # удаляются вместе с соседним куском.
+        queryset = FollowSuggestion.objects.all()
+        if position:
+            queryset = queryset.filter(user_id__gte=graph.ids[start])
+        if position + 1 < len(starts):
+            queryset = queryset.filter(
+                user_id__lt=graph.ids[starts[position + 1]])
+        _replace(queryset, chunks.pop(start))
+    return total, time.monotonic() - started
+
+
+def for_user(user, limit=None):
+    """Сохранённые рекомендации без авторов, на которых уже подписались."""
+    if not user.is_authenticated:
+        return []
+    limit = limit or settings.SUGGESTIONS_SHOWN
+    return list(
+        FollowSuggestion.objects.filter(user=user)
+        .exclude(suggested__following__user=user)
+        .select_related('suggested')
+        .order_by('-mutual', 'suggested_id')[:limit])
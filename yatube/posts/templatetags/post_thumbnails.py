@@ -0,0 +1,48 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+from sorl.thumbnail import default
+
+from posts.thumbnails import MIME_TYPES, variants
+
+register = template.Library()
+
+
+@register.simple_tag
+def prefetch_thumbnails(posts, geometry_string, **options):
+    """Подгружает миниатюры всей страницы одним запросом до цикла."""
+    default.backend.prefetch(
+        [post.image for post in posts], geometry_string, **options)
+    return ''
+
+
+@register.simple_tag
+def picture(image, geometry_string, css_class='', **options):
+    """<picture> с AVIF/WebP/JPEG разных ширин; готовые варианты — в srcset.
+
+    Пока вариант не нарезан, бэкенд отдаёт оригинал — такой вариант
+    в srcset не попадает, а <img> показывает оригинал.
+    """
+    if not image:
+        return ''
+    width = int(geometry_string.split('x')[0])
+    sizes = f'(max-width: {width}px) 100vw, {width}px'
+    fallback = default.backend.get_thumbnail(
+        image, geometry_string, **options)
+
+    srcsets = {}
+    for variant, variant_options in variants(geometry_string, options):
+        thumbnail = default.backend.get_thumbnail(
+            image, variant, **variant_options)
+        if thumbnail.name != image.name:
+            srcsets.setdefault(variant_options['format'], []).append(
+                f'{thumbnail.url} {variant.split("x")[0]}w')
+
+    jpeg = srcsets.pop('JPEG', [])
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((MIME_TYPES[format_], ', '.join(srcset), sizes)
+         for format_, srcset in srcsets.items()))
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" sizes="{}">'
+        '</picture>',
+        sources, css_class, fallback.url, ', '.join(jpeg), sizes)
@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.paginator import EstimatedCountPaginator
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+class PostAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, **params):
+        return self.client.get(
+            reverse('admin:posts_post_changelist'), params)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """ Число запросов списка постов не зависит от числа строк """
+        Post.objects.create(text='пост', author=self.admin, group=self.group)
+        with CaptureQueriesContext(connection) as one:
+            self.changelist()
+        for number in range(5):
+            Post.objects.create(
+                text=f'пост {number}', author=self.admin, group=self.group)
+        with CaptureQueriesContext(connection) as many:
+            self.changelist()
+        self.assertEqual(len(one), len(many))
+
+    def test_search_uses_full_text_index(self):
+        post = Post.objects.create(text='Про кошек', author=self.admin)
+        Post.objects.create(text='Про собак', author=self.admin)
+        response = self.changelist(q='кошек')
+        self.assertEqual(list(response.context['cl'].result_list), [post])
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='Author')
+        self.posts = [Post.objects.create(text=f'пост {number}',
+                                          author=self.user)
+                      for number in range(3)]
+
+    def test_unfiltered_count_is_max_pk(self):
+        self.posts[1].delete()
+        paginator = EstimatedCountPaginator(Post.objects.order_by('-pk'), 10)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, self.posts[-1].pk)
+        self.assertNotIn('COUNT', queries[0]['sql'])
+
+    def test_filtered_count_is_exact_under_limit(self):
+        paginator = EstimatedCountPaginator(
+            Post.objects.filter(author=self.user).order_by('-pk'), 10)
+        paginator.count_limit = 3
+        self.assertEqual(paginator.count, 3)
+
+    def test_filtered_count_past_limit_never_undercounts(self):
+        """ Длинная выборка не обрезается: все страницы достижимы """
+        paginator = EstimatedCountPaginator(
+            Post.objects.filter(author=self.user).order_by('-pk'), 1)
+        paginator.count_limit = 2
+        self.assertGreaterEqual(paginator.count, 3)
+        self.assertEqual(
+            list(paginator.page(3).object_list), [self.posts[0]])
@@ -1,6 +1,10 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
 
-from posts.models import Group, Post, User
+from posts.models import Comment, Follow, Group, Post, User, UserCounter
 
 
 class CommonModelsTests(TestCase):
@@ -25,3 +29,100 @@ class CommonModelsTests(TestCase):
         group = self.group
         expected_str = group.title
         self.assertEquals(expected_str, str(group))
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(title='g', slug='g', description='')
+
+    def test_counters_follow_changes(self):
+        """ Счётчики обновляются при создании и удалении объектов """
+        post = Post.objects.create(
+            text='пост', author=self.author, group=self.group)
+        Comment.objects.create(text='к', post=post, author=self.reader)
+        Follow.objects.create(user=self.reader, author=self.author)
+
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(UserCounter.objects.get(
+            user=self.author).posts_count, 1)
+        self.assertEqual(UserCounter.objects.get(
+            user=self.author).followers_count, 1)
+        self.assertEqual(UserCounter.objects.get(
+            user=self.reader).following_count, 1)
+
+        post.group = None
+        post.save()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+
+        post.delete()
+        Follow.objects.all().delete()
+        counters = UserCounter.objects.get(user=self.author)
+        self.assertEqual(counters.posts_count, 0)
+        self.assertEqual(counters.followers_count, 0)
+
+    def test_recount_repairs_drift(self):
+        post = Post.objects.create(
+            text='пост', author=self.author, group=self.group)
+        Comment.objects.create(text='к', post=post, author=self.reader)
+        UserCounter.objects.update(posts_count=42)
+        Post.objects.update(comments_count=0)
+
+        call_command('recount', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(UserCounter.objects.get(
+            user=self.author).posts_count, 1)
+
+    def test_save_of_stale_instance_keeps_counters(self):
+        """ save() устаревшего экземпляра не затирает счётчики """
+        group = Group.objects.get(pk=self.group.pk)
+        post = Post.objects.create(
+            text='пост', author=self.author, group=self.group)
+        Comment.objects.create(text='к', post=post, author=self.reader)
+        Post.objects.filter(pk=post.pk).update(views_count=5)
+
+        post.text = 'правка'
+        post.save()
+        group.title = 'новое название'
+        group.save()
+        post.refresh_from_db()
+        group.refresh_from_db()
+        self.assertEqual(post.text, 'правка')
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(post.views_count, 5)
+        self.assertEqual(group.title, 'новое название')
+        self.assertEqual(group.posts_count, 1)
+
+
+class FeedIndexesTests(TestCase):
+    def assert_sorted_by_index(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertNotIn('TEMP B-TREE', plan)
+        return plan
+
+    def test_feeds_use_composite_indexes(self):
+        """ Ленты сортируются по индексу без временного B-дерева """
+        user = User.objects.create(username='author')
+        group = Group.objects.create(title='g', slug='g', description='')
+        feeds = {
+            'post_author_pub_date_idx': user.posts.order_by(
+                '-pub_date', '-pk')[:10],
+            'post_group_pub_date_idx': group.posts.order_by(
+                '-pub_date', '-pk')[:10],
+            'comment_post_created_idx': Comment.objects.filter(
+                post_id=1).order_by('-created', '-pk')[:10],
+        }
+        for index, queryset in feeds.items():
+            with self.subTest(index=index):
+                self.assertIn(index, self.assert_sorted_by_index(queryset))
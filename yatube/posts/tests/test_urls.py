@@ -63,6 +63,12 @@ class PostURLTests(TestCase):
             [f'/posts/{PostURLTests.post.pk}/', 'posts/post_detail.html'],
             [f'/posts/{PostURLTests.post.pk}/edit/', 'posts/create_post.html'],
             ['/create/', 'posts/create_post.html'],
+            ['/search/', 'posts/search.html'],
+            ['/popular/', 'posts/popular.html'],
+            [f'/profile/{PostURLTests.user.username}/followers/',
+             'posts/follow_list.html'],
+            [f'/profile/{PostURLTests.user.username}/following/',
+             'posts/follow_list.html'],
         ]
         for url, template, in templates_pages_names:
             with self.subTest(url=url):
@@ -1,15 +1,37 @@
+import json
 import shutil
 import tempfile
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.template import Context, Template
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from PIL import Image as PILImage
 
-from posts.models import Follow, Group, Post
+from core import metrics
+from posts import (
+    feed_cache, ranking, suggestions, thumbnails, timeline, view_counts,
+)
+from posts.models import (
+    Comment, Follow, FollowSuggestion, Group, Post, PostScore, TimelineEntry,
+    UserCounter,
+)
+from posts.thumbnails import (
+    MIME_TYPES, BackgroundThumbnailBackend, BatchedKVStore, available_formats,
+    reset_memo, source_width, variants,
+)
+from posts.utils import encode_cursor
 
 User = get_user_model()
 
@@ -46,6 +68,53 @@ class TestPaginator(TestCase):
             len(response.context['page_obj'].object_list),
             Post.objects.count() - settings.POST_LENGTH)
 
+    @override_settings(MAX_PAGE_NUMBER=1)
+    def test_numbered_pages_capped(self):
+        """ ?page= за пределом окна даёт последнюю страницу окна """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:index'), {'page': 10 ** 6})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 1)
+        self.assertEqual(page_obj.paginator.count, settings.POST_LENGTH)
+        self.assertTrue([query['sql'] for query in queries.captured_queries
+                         if 'COUNT' in query['sql']
+                         and 'LIMIT' in query['sql']])
+
+    def test_cursor_pages_cover_all_records(self):
+        """ Курсорная пагинация: страницы по after/before без пропусков """
+        response = self.client.get(reverse('posts:index'))
+        first_page = list(response.context['page_obj'])
+        next_cursor = response.context['paginator'].next_cursor
+
+        response = self.client.get(
+            reverse('posts:index') + f'?after={next_cursor}')
+        second_page = list(response.context['page_obj'])
+        self.assertEqual(
+            len(second_page), Post.objects.count() - settings.POST_LENGTH)
+        self.assertFalse(response.context['page_obj'].has_next())
+        self.assertEqual(
+            first_page + second_page,
+            list(Post.objects.order_by('-pub_date', '-pk')))
+
+        previous_cursor = response.context['paginator'].previous_cursor
+        response = self.client.get(
+            reverse('posts:index') + f'?before={previous_cursor}')
+        self.assertEqual(list(response.context['page_obj']), first_page)
+
+    def test_invalid_cursor_returns_first_page(self):
+        response = self.client.get(reverse('posts:index') + '?after=bad')
+        self.assertEqual(
+            len(response.context['page_obj'].object_list),
+            settings.POST_LENGTH)
+
+    def test_out_of_range_cursor_returns_first_page(self):
+        """ id за пределами INTEGER — первая страница, а не ошибка 500 """
+        cursor = encode_cursor(Post.objects.first().pub_date, 10 ** 30)
+        response = self.client.get(reverse('posts:index'), {'after': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
     def test_group_page_contains_ten_records(self):
         response = self.client.get(
             reverse('posts:group_posts', kwargs={'slug': self.group.slug}))
@@ -286,27 +355,34 @@ class CommonViewsTests(TestCase):
 
     def test_cache(self):
         """ Тестирование работы кэша"""
-        # Делаем запрос до создания поста
+        cache.clear()
         response_before = self.authorized_client.get(reverse('posts:index'))
 
-        # Создаем пост
-        post = Post.objects.create(text='test', author=self.user)
+        # update() не шлёт сигналов — страница отдаётся из кэша
+        Post.objects.filter(id=self.post.id).update(text='изменено')
+        response_cached = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(response_before.content, response_cached.content)
+
+        # Создание поста сдвигает поколение — кэш ленты сброшен
+        post = Post.objects.create(text='новый пост', author=self.user)
         response_after = self.authorized_client.get(reverse('posts:index'))
-        Post.objects.filter(id=post.id).delete()
+        self.assertContains(response_after, 'новый пост')
+        self.assertContains(response_after, 'изменено')
 
-        # Удалили пост из бд, но на странице должен еще быть
+        post.delete()
         response_after_delete = self.authorized_client.get(
             reverse('posts:index'))
-        self.assertEqual(response_after.content, response_after_delete.content)
+        self.assertNotContains(response_after_delete, 'новый пост')
+        Post.objects.filter(id=self.post.id).update(text=self.post.text)
 
-        # Пост должен быть удален с главной страницы
-        cache.clear()
-        response_after_clear = self.authorized_client.get(
-            reverse('posts:index'))
-        # До создания был 1 пост из setUp
-        self.assertEqual(
-            response_after_clear.context['paginator'].count,
-            response_before.context['paginator'].count)
+    def test_cache_is_page_aware(self):
+        """ Разные страницы ленты кэшируются под разными ключами """
+        for i in range(settings.POST_LENGTH):
+            Post.objects.create(text=f'пост {i}', author=self.user)
+        first = self.client.get(reverse('posts:index') + '?page=1')
+        second = self.client.get(reverse('posts:index') + '?page=2')
+        self.assertNotEqual(first.content, second.content)
+        self.assertIn(self.post, second.context['page_obj'])
 
     def test_authorized_user_follow(self):
         """ Тестирование подписки авторизованным пользователем """
@@ -370,3 +446,821 @@ class CommonViewsTests(TestCase):
         self.assertEqual(response.context['paginator'].count, 0, (
             'Посты неотслеживаемого автора появляются на странице избранных'
         ))
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='Author')
+        cls.reader = User.objects.create(username='Reader')
+        cls.reader_client = Client()
+        cls.reader_client.force_login(cls.reader)
+
+    def test_new_post_pushed_to_followers(self):
+        """ Новый пост попадает в материализованную ленту подписчика """
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='в ленту', author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'].object_list, [post])
+
+    @override_settings(MAX_PAGE_NUMBER=1, POST_LENGTH=2)
+    def test_numbered_timeline_page_capped(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        for i in range(5):
+            Post.objects.create(text=f'пост {i}', author=self.author)
+        response = self.reader_client.get(
+            reverse('posts:follow_index'), {'page': 3})
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(response.context['paginator'].count, 2)
+
+    def test_follow_backfills_and_unfollow_cleans(self):
+        post = Post.objects.create(text='старый пост', author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+
+        Follow.objects.filter(user=self.reader, author=self.author).delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader).exists())
+
+    def test_rebuild_timelines_command(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='пост', author=self.author)
+        TimelineEntry.objects.all().delete()
+
+        call_command('rebuild_timelines', self.reader.username,
+                     stdout=StringIO())
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+
+    @override_settings(TIMELINE_BATCH_SIZE=2, TIMELINE_FANOUT_THRESHOLD=3)
+    def test_rebuild_inserts_per_chunk_of_readers(self):
+        """ Пересборка — один INSERT … SELECT на кусок читателей """
+        readers = [User.objects.create(username=f'R{i}') for i in range(3)]
+        heavy = User.objects.create(username='Heavy')
+        for reader in readers:
+            Follow.objects.create(user=reader, author=self.author)
+            Follow.objects.create(user=reader, author=heavy)
+        Follow.objects.create(user=self.reader, author=heavy)
+        posts = [Post.objects.create(text=f'пост {i}', author=self.author)
+                 for i in range(3)]
+        Post.objects.create(text='на лету', author=heavy)
+        expected = set(TimelineEntry.objects.values_list('user_id', 'post_id'))
+        TimelineEntry.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as queries:
+            timeline.rebuild()
+        inserts = [query for query in queries
+                   if query['sql'].startswith('INSERT')]
+        chunks = -(-User.objects.count() // 2)
+        self.assertEqual(len(inserts), chunks)
+        # Список читателей, затем на кусок: SAVEPOINT, DELETE, INSERT,
+        # RELEASE — без запросов на каждую подписку.
+        self.assertEqual(len(queries), 1 + 4 * chunks)
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list('user_id', 'post_id')),
+            expected)
+        self.assertEqual(len(expected), len(readers) * len(posts))
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=0)
+    def test_heavy_author_posts_pulled_and_merged(self):
+        """ Посты популярного автора читаются на лету и сливаются с лентой """
+        cache.clear()
+        other = User.objects.create(username='Other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=other)
+        posts = [
+            Post.objects.create(text=f'пост {i}', author=author)
+            for i, author in enumerate([self.author, other] * 3)
+        ]
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.reader).exists())
+
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            response.context['page_obj'].object_list, posts[::-1])
+        self.assertEqual(metrics.snapshot()['timeline_fanout_threshold'], 0)
+        cache.clear()
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+    def test_author_stays_pulled_after_dropping_below_threshold(self):
+        """ Посты, не разложенные у популярного автора, не пропадают """
+        cache.clear()
+        fans = [User.objects.create(username=f'Fan{i}') for i in range(2)]
+        for fan in fans:
+            Follow.objects.create(user=fan, author=self.author)
+        post = Post.objects.create(text='без раскладки', author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+
+        Follow.objects.filter(user__in=fans).delete()
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'].object_list, [post])
+        cache.clear()
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=0)
+    def test_follow_index_does_not_write(self):
+        """ Чтение ленты не пишет в базу: автор переведён при подписке """
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(self.author.counters.pull_timeline)
+        with CaptureQueriesContext(connection) as queries:
+            self.reader_client.get(reverse('posts:follow_index'))
+        self.assertFalse([query for query in queries
+                          if query['sql'].startswith(('UPDATE', 'INSERT'))])
+
+
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='Author')
+        cls.post = Post.objects.create(text='первый пост', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_page_served_from_cache(self):
+        """ Повторный анонимный запрос отдаётся из кэша с тем же ETag """
+        url = reverse('posts:profile', kwargs={'username': 'Author'})
+        first = self.client.get(url)
+        second = self.client.get(url)
+        self.assertIsNotNone(first.context)
+        self.assertIsNone(second.context)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Last-Modified', second)
+
+    def test_cached_page_keeps_inner_middleware_headers(self):
+        """ Ответ из кэша сохраняет X-Frame-Options и другие заголовки """
+        url = reverse('posts:profile', kwargs={'username': 'Author'})
+        first = self.client.get(url)
+        second = self.client.get(url)
+        self.assertIsNone(second.context)
+        self.assertEqual(second['X-Frame-Options'], first['X-Frame-Options'])
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+
+    def test_last_modified_tracks_content_not_generation(self):
+        url = reverse('posts:index')
+        with mock.patch('posts.middleware.time.time', return_value=1000):
+            first = self.client.get(url)
+        Group.objects.create(title='Группа', slug='other', description='-')
+        with mock.patch('posts.middleware.time.time', return_value=2000):
+            second = self.client.get(url)
+        self.assertIsNotNone(second.context)
+        self.assertEqual(second['Last-Modified'], first['Last-Modified'])
+
+    def test_unknown_query_params_share_cache_entry(self):
+        """ Посторонние параметры запроса не создают новых ключей """
+        url = reverse('posts:index')
+        self.client.get(url, {'page': 1})
+        with mock.patch('posts.middleware.cache.set',
+                        wraps=cache.set) as cache_set:
+            response = self.client.get(
+                url, {'page': 1, 'utm_source': 'mail', 'x': 'y'})
+        self.assertIsNone(response.context)
+        cache_set.assert_not_called()
+
+        with mock.patch('posts.middleware.cache.set',
+                        wraps=cache.set) as cache_set:
+            self.client.get(url, {'page': 2})
+        timeouts = {args[0].split(':')[0]: args[2]
+                    for args, _ in cache_set.call_args_list}
+        self.assertEqual(timeouts['page-modified'],
+                         settings.PAGE_MODIFIED_TTL)
+
+    def test_conditional_get_returns_304(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_post_changes_purge_page_cache(self):
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        Post.objects.create(text='второй пост', author=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'второй пост')
+
+    def test_authorized_pages_not_cached(self):
+        client = Client()
+        client.force_login(self.user)
+        client.get(reverse('posts:index'))
+        self.assertIsNotNone(client.get(reverse('posts:index')).context)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BackgroundThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        cls.post = Post.objects.create(
+            text='с картинкой',
+            author=User.objects.create(username='TestUser'),
+            image=SimpleUploadedFile('thumb.gif', small_gif, 'image/gif'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_original_served_until_thumbnail_ready(self):
+        """ Пока миниатюры нет, в шаблон отдаётся оригинал """
+        backend = BackgroundThumbnailBackend()
+        options = {'crop': 'center', 'upscale': True}
+        image = backend.get_thumbnail(self.post.image, '960x339', **options)
+        self.assertEqual(image.name, self.post.image.name)
+
+        backend.generate(self.post.image, '960x339', **options)
+        image = backend.get_thumbnail(self.post.image, '960x339', **options)
+        self.assertNotEqual(image.name, self.post.image.name)
+        self.assertEqual(image.width, 960)
+
+    def test_thumbnails_invalidate_feeds_once_per_image(self):
+        """ Все геометрии картинки сбрасывают кэш лент один раз """
+        generation = feed_cache.get_generation()
+        geometries = [('100x100', {'crop': 'center'}), ('50x50', {})]
+        with mock.patch.object(
+                BatchedKVStore, 'invalidate',
+                autospec=True, side_effect=BatchedKVStore.invalidate) as (
+                invalidate):
+            self.assertEqual(
+                thumbnails.generate_all(self.post.image, geometries), [])
+        self.assertEqual(feed_cache.get_generation(), generation + 1)
+        invalidate.assert_called_once()
+        self.assertTrue(invalidate.call_args[0][1])
+
+    def test_queued_thumbnail_skipped_after_media_root_changed(self):
+        """ Задача из очереди не пишет в сменившийся MEDIA_ROOT """
+        with mock.patch.object(BackgroundThumbnailBackend, 'generate') as (
+                generate), mock.patch('posts.thumbnails.connection'):
+            thumbnails._task('/nonexistent', self.post.image, [('1x1', {})])
+        generate.assert_not_called()
+
+    def test_prefetch_batches_thumbnail_lookups(self):
+        """ Миниатюры страницы подгружаются одним запросом """
+        backend = BackgroundThumbnailBackend()
+        options = {'crop': 'center', 'upscale': True}
+        images = [self.post.image] * 3
+        cache.clear()
+        reset_memo()
+        with CaptureQueriesContext(connection) as queries:
+            backend.prefetch(images, '960x339', **options)
+            for image in images:
+                backend.get_thumbnail(image, '960x339', **options)
+        self.assertEqual(len(queries), 1)
+
+    @override_settings(THUMBNAIL_MEMO_SIZE=2)
+    def test_prefetch_memo_is_bounded(self):
+        """ Память потока держит не больше THUMBNAIL_MEMO_SIZE ключей """
+        backend = BackgroundThumbnailBackend()
+        reset_memo()
+        for geometry_string in ('10x10', '20x20', '30x30'):
+            backend.prefetch([self.post.image], geometry_string)
+        memo = BatchedKVStore._local.memo
+        self.assertEqual(len(memo), 2)
+        backend.generate(self.post.image, '40x40')
+        self.assertLessEqual(len(BatchedKVStore._local.memo), 2)
+
+    def test_picture_lists_ready_variants(self):
+        """ В srcset попадают только нарезанные варианты """
+        options = {'crop': 'center', 'upscale': True}
+        template = Template(
+            '{% load post_thumbnails %}'
+            '{% picture post.image "960x339" crop="center" upscale=True %}')
+        wide = BytesIO()
+        PILImage.new('RGB', (1500, 530)).save(wide, 'PNG')
+        post = Post.objects.create(
+            text='другая картинка', author=self.post.author,
+            image=SimpleUploadedFile(
+                'picture.png', wide.getvalue(), 'image/png'))
+        html = template.render(Context({'post': post}))
+        self.assertIn(post.image.url, html)
+        self.assertNotIn('480w', html)
+
+        backend = BackgroundThumbnailBackend()
+        geometries = variants('960x339', options, source_width(post.image))
+        for geometry_string, variant_options in geometries:
+            backend.generate(post.image, geometry_string, **variant_options)
+        html = template.render(Context({'post': post}))
+        for format_ in available_formats():
+            if format_ != 'JPEG':
+                self.assertIn(MIME_TYPES[format_], html)
+        self.assertIn('480w', html)
+        self.assertIn('1440w', html)
+
+    def test_variants_not_wider_than_source(self):
+        """ Варианты шире исходника не готовятся """
+        widths = {geometry_string.split('x')[0]
+                  for geometry_string, _ in variants('960x339', {}, 1000)}
+        self.assertEqual(widths, {'480', '960'})
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='Author')
+        self.post = Post.objects.create(
+            text='Кошки любят <b>молоко</b>', author=self.user)
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:search'), {'q': query, **params})
+
+    def test_search_finds_and_highlights_posts(self):
+        """ Поиск находит пост и подсвечивает совпадение без XSS """
+        response = self.search('кош')
+        hits = list(response.context['page_obj'])
+        self.assertEqual([hit.post for hit in hits], [self.post])
+        self.assertIn('<mark>Кошки</mark>', hits[0].snippet)
+        self.assertIn('&lt;b&gt;', hits[0].snippet)
+
+    def test_index_follows_edits_comments_and_deletes(self):
+        """ Индекс обновляется вместе с постами и комментариями """
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='а собаки — нет')
+        hits = list(self.search('собаки').context['page_obj'])
+        self.assertEqual([hit.comment for hit in hits], [comment])
+
+        self.post.text = 'Про рыбок'
+        self.post.save()
+        self.assertFalse(self.search('кошки').context['page_obj'])
+
+        self.post.delete()
+        self.assertFalse(self.search('рыбок').context['page_obj'])
+        self.assertFalse(self.search('собаки').context['page_obj'])
+
+    @override_settings(POST_LENGTH=2)
+    def test_results_are_cursor_paginated(self):
+        for number in range(4):
+            Post.objects.create(text=f'молоко {number}', author=self.user)
+        first = self.search('молоко')
+        paginator = first.context['paginator']
+        self.assertTrue(first.context['page_obj'].has_next())
+        second = self.search('молоко', after=paginator.next_cursor)
+        third = self.search(
+            'молоко', after=second.context['paginator'].next_cursor)
+        rowids = [hit.rowid for response in (first, second, third)
+                  for hit in response.context['page_obj']]
+        self.assertEqual(len(rowids), 5)
+        self.assertEqual(len(set(rowids)), 5)
+        self.assertFalse(third.context['page_obj'].has_next())
+
+    @override_settings(POST_LENGTH=1)
+    def test_stale_index_rows_do_not_shorten_pages(self):
+        """ Строки индекса без поста отбрасываются до LIMIT """
+        with connection.cursor() as cursor:
+            for pk in (10 ** 6, 10 ** 6 + 1):
+                cursor.execute(
+                    'INSERT INTO posts_search (rowid, text, post_id) '
+                    'VALUES (%s, %s, %s)', [pk * 2, 'молоко', pk])
+            cursor.execute(
+                'INSERT INTO posts_search (rowid, text, post_id) '
+                'VALUES (%s, %s, %s)',
+                [10 ** 6 * 2 + 1, 'молоко', self.post.pk])
+        response = self.search('молоко')
+        self.assertEqual(
+            [hit.post for hit in response.context['page_obj']], [self.post])
+        self.assertFalse(response.context['page_obj'].has_next())
+
+    def test_operators_in_query_are_ignored(self):
+        response = self.search('"молоко" OR (')
+        self.assertEqual(response.status_code, 200)
+
+    def test_rebuild_search_index_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM posts_search')
+        self.assertFalse(self.search('кошки').context['page_obj'])
+        call_command('rebuild_search_index', chunk_size=1, stdout=StringIO())
+        self.assertTrue(self.search('кошки').context['page_obj'])
+
+
+class ImportContentTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='Author')
+        self.reader = User.objects.create(username='Reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        path = f'{self.directory}/{name}'
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        return path
+
+    def test_jsonl_import_with_deferred_maintenance(self):
+        """ Импорт JSONL вставляет строки и пересобирает производные данные """
+        path = self.write('content.jsonl', '\n'.join([
+            '{"type": "follow", "user": "Reader", "author": "Author"}',
+            '{"type": "post", "id": 500, "author": "Author", '
+            '"group": "group", "text": "импортный пост", '
+            '"pub_date": "2020-01-02T03:04:05"}',
+            '{"type": "comment", "post": 500, "author": "Reader", '
+            '"text": "импортный комментарий"}',
+            '{"type": "post", "author": "Nobody", "text": "потеряется"}',
+        ]))
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_content', path, batch_size=2,
+                     stdout=stdout, stderr=stderr)
+
+        post = Post.objects.get(pk=500)
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Group.objects.get().posts_count, 1)
+        self.assertEqual(self.author.counters.followers_count, 1)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+        response = self.client.get(reverse('posts:search'), {'q': 'импорт'})
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertIn('Nobody', stderr.getvalue())
+        self.assertIn('строк/с', stdout.getvalue())
+
+    def test_import_maintains_only_touched_rows(self):
+        """ После импорта пересчитываются только затронутые им данные """
+        other = User.objects.create(username='Other')
+        Post.objects.create(author=other, text='чужой пост')
+        UserCounter.objects.filter(user=other).update(posts_count=42)
+        path = self.write('scoped.jsonl', '\n'.join([
+            '{"type": "follow", "user": "Reader", "author": "Author"}',
+            '{"type": "post", "author": "Author", "text": "новый пост"}',
+        ]))
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_content', path, stdout=StringIO())
+
+        self.assertEqual(UserCounter.objects.get(user=other).posts_count, 42)
+        self.assertEqual(self.author.counters.posts_count, 1)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 1)
+        self.assertFalse([query['sql'] for query in queries.captured_queries
+                          if query['sql'].startswith('DELETE')
+                          and 'WHERE' not in query['sql']])
+
+    def test_malformed_row_keeps_committed_batches_consistent(self):
+        """ Битая строка после вставленных пачек не оставляет их без лент """
+        Follow.objects.create(user=self.reader, author=self.author)
+        path = self.write('broken.jsonl', '\n'.join([
+            '{"type": "post", "author": "Author", "text": "успел"}',
+            '{"type": "post", "author": "Author", "text": "тоже успел"}',
+            '{"type": "post", "author": "Author", "text": "оборван',
+        ]))
+        with self.assertRaises(CommandError):
+            call_command('import_content', path, batch_size=1,
+                         stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(self.author.counters.posts_count, 2)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2)
+        response = self.client.get(reverse('posts:search'), {'q': 'успел'})
+        self.assertEqual(len(response.context['page_obj']), 2)
+
+    def test_duplicate_id_reported_not_raised(self):
+        Post.objects.create(pk=7, author=self.author, text='уже есть')
+        path = self.write('duplicate.jsonl', '\n'.join([
+            '{"type": "post", "id": 7, "author": "Author", "text": "дубль"}',
+            '{"type": "post", "author": "Author", "text": "следующий"}',
+        ]))
+        stderr = StringIO()
+        call_command('import_content', path, batch_size=1,
+                     stdout=StringIO(), stderr=stderr)
+        self.assertIn('строка 1', stderr.getvalue())
+        self.assertEqual(
+            list(Post.objects.order_by('pk').values_list('text', flat=True)),
+            ['уже есть', 'следующий'])
+
+    def test_csv_import_with_type_option(self):
+        path = self.write(
+            'follows.csv', 'user,author\nReader,Author\nReader,Author\n')
+        call_command('import_content', path, type='follow',
+                     stdout=StringIO())
+        self.assertEqual(Follow.objects.count(), 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ExportTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = User.objects.create(username='Author')
+        other = User.objects.create(username='Other')
+        self.post = Post.objects.create(
+            text='мой пост', author=self.user,
+            image=SimpleUploadedFile('export.gif', b'GIF89a', 'image/gif'))
+        Comment.objects.create(post=self.post, author=self.user, text='мой')
+        Comment.objects.create(post=self.post, author=other, text='чужой')
+        Follow.objects.create(user=self.user, author=other)
+        self.client.force_login(self.user)
+
+    def test_jsonl_export_streams_own_rows(self):
+        """ Выгрузка отдаёт потоком только строки пользователя """
+        response = self.client.get(reverse('posts:export'))
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in
+                b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            [row['type'] for row in rows], ['post', 'comment', 'follow'])
+        self.assertEqual(rows[2]['author'], 'Other')
+
+    def test_zip_export_includes_images(self):
+        response = self.client.get(reverse('posts:export_archive'))
+        archive = zipfile.ZipFile(
+            BytesIO(b''.join(response.streaming_content)))
+        self.assertIn(f'images/{self.post.image.name}', archive.namelist())
+        self.assertEqual(
+            len(archive.read('export.jsonl').decode().splitlines()), 3)
+
+    def test_export_user_command_round_trips_through_import(self):
+        path = f'{settings.MEDIA_ROOT}/export.jsonl'
+        call_command('export_user', 'Author', output=path, chunk_size=1)
+        Post.objects.all().delete()
+        call_command('import_content', path, stdout=StringIO())
+        self.assertTrue(Post.objects.filter(
+            pk=self.post.pk, text='мой пост').exists())
+        self.assertEqual(Comment.objects.get().text, 'мой')
+
+
+@override_settings(COMMENTS_PAGE_SIZE=2)
+class CommentsPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='Author')
+        self.post = Post.objects.create(text='пост', author=self.user)
+        self.comments = [
+            Comment.objects.create(
+                post=self.post, text=f'комментарий {number}',
+                author=User.objects.create(username=f'Reader{number}'))
+            for number in range(5)
+        ]
+        self.client.force_login(self.user)
+
+    def test_detail_shows_first_page_with_authors_joined(self):
+        """ На странице поста — первая страница комментариев без N+1 """
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(list(comments), self.comments[:-3:-1])
+        self.assertContains(response, 'Показать ещё')
+        # Отдельным запросом грузится только вошедший пользователь.
+        user_lookups = [query for query in queries
+                        if query['sql'].startswith('SELECT "auth_user"')]
+        self.assertEqual(len(user_lookups), 1)
+
+    def test_load_more_returns_fragment_until_exhausted(self):
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        after = self.client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )).context['comments'].paginator.next_cursor
+        texts = []
+        while after:
+            response = self.client.get(url, {'after': after})
+            self.assertTemplateUsed(response, 'posts/includes/comments.html')
+            self.assertNotContains(response, '<html')
+            comments = response.context['comments']
+            texts += [comment.text for comment in comments]
+            after = comments.paginator.next_cursor
+        self.assertEqual(
+            texts, [comment.text for comment in self.comments[2::-1]])
+
+
+class ViewCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        view_counts.reset()
+        self.addCleanup(view_counts.reset)
+        self.user = User.objects.create(username='Author')
+        self.posts = [Post.objects.create(text=f'пост {number}',
+                                          author=self.user)
+                      for number in range(3)]
+
+    def test_flush_batches_updates_by_delta(self):
+        """ Просмотры копятся в памяти, сброс — UPDATE на приращение """
+        first, second, third = self.posts
+        for post in (first, first, second, second, third):
+            view_counts.record(post.pk)
+        self.assertEqual(view_counts.pending(first.pk), 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(view_counts.flush(), 5)
+        updates = [query for query in queries
+                   if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(
+            [post.views_count for post in Post.objects.order_by('pk')],
+            [2, 2, 1])
+        self.assertEqual(view_counts.pending(first.pk), 0)
+
+    def test_failed_flush_keeps_views_in_buffer(self):
+        """ Ошибка базы не теряет просмотры и не роняет запрос """
+        post = self.posts[0]
+        view_counts.record(post.pk)
+        with mock.patch.object(Post.objects, 'filter',
+                               side_effect=DatabaseError('locked')):
+            with self.assertLogs('posts.view_counts', 'ERROR'):
+                self.assertEqual(view_counts.flush(), 0)
+        view_counts.record(post.pk)
+        self.assertEqual(view_counts.pending(post.pk), 2)
+        self.assertEqual(view_counts.flush(), 2)
+        post.refresh_from_db()
+        self.assertEqual(post.views_count, 2)
+
+    def test_detail_view_records_on_cache_hit(self):
+        """ Страница поста из кэша анонимов тоже засчитывает просмотр """
+        post = self.posts[0]
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.assertIsNotNone(self.client.get(url).context)
+        self.assertIsNone(self.client.get(url).context)
+        self.assertEqual(view_counts.pending(post.pk), 2)
+        view_counts.flush()
+        post.refresh_from_db()
+        self.assertEqual(post.views_count, 2)
+
+    @override_settings(VIEW_COUNT_FLUSH_SIZE=1)
+    def test_flushed_after_request_when_buffer_full(self):
+        post = self.posts[0]
+        self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        post.refresh_from_db()
+        self.assertEqual(post.views_count, 1)
+
+
+class PopularTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='Author')
+        self.quiet, self.busy = [
+            Post.objects.create(text=text, author=self.author)
+            for text in ('тихий пост', 'обсуждаемый пост')]
+        self.reader = User.objects.create(username='Reader')
+        Comment.objects.create(post=self.busy, author=self.reader, text='!')
+
+    def test_refresh_ranks_by_engagement(self):
+        self.assertEqual(ranking.refresh(), (2, 0))
+        self.assertEqual(ranking.top(), [self.busy, self.quiet])
+
+    def test_refresh_rescores_only_touched_posts(self):
+        """ Повторный запуск трогает только изменившиеся посты """
+        ranking.refresh()
+        self.assertEqual(ranking.refresh(), (0, 0))
+        Post.objects.filter(pk=self.quiet.pk).update(views_count=100)
+        self.assertEqual(ranking.refresh(), (1, 0))
+        self.assertEqual(ranking.top(), [self.quiet, self.busy])
+
+    def test_follows_after_publication_count(self):
+        ranking.refresh()
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(ranking.refresh(), (2, 0))
+        self.assertEqual(
+            set(PostScore.objects.values_list('follows', flat=True)), {1})
+
+    def test_old_posts_pruned(self):
+        ranking.refresh()
+        Post.objects.filter(pk=self.busy.pk).update(
+            pub_date=timezone.now() - settings.POPULAR_WINDOW * 2)
+        PostScore.objects.filter(post=self.busy).update(
+            pub_date=timezone.now() - settings.POPULAR_WINDOW * 2)
+        self.assertEqual(ranking.refresh(), (0, 1))
+        self.assertEqual(ranking.top(), [self.quiet])
+
+    def test_popular_page_reads_ranking_in_one_query(self):
+        call_command('rank_popular', '--once', stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:popular'))
+        self.assertEqual(
+            list(response.context['page_obj']), [self.busy, self.quiet])
+        ranking_queries = [query for query in queries
+                           if 'posts_postscore' in query['sql']]
+        self.assertEqual(len(queries), len(ranking_queries))
+        self.assertEqual(len(ranking_queries), 1)
+        self.assertContains(response, 'Популярное')
+
+
+class SuggestionsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = {name: User.objects.create(username=name)
+                      for name in ('me', 'a', 'b', 'c', 'd')}
+        for user, author in [('me', 'a'), ('me', 'b'), ('a', 'c'),
+                             ('b', 'c'), ('b', 'd'), ('a', 'me')]:
+            Follow.objects.create(user=self.users[user],
+                                  author=self.users[author])
+
+    def test_graph_is_compact_adjacency(self):
+        graph = suggestions.load_graph()
+        me = list(graph.ids).index(self.users['me'].pk)
+        self.assertEqual(
+            sorted(graph.ids[index] for index in graph.following(me)),
+            [self.users['a'].pk, self.users['b'].pk])
+        self.assertEqual(len(graph.targets), Follow.objects.count())
+
+    def test_rebuild_ranks_friends_of_friends(self):
+        """ Рекомендации по числу общих подписок, без уже читаемых """
+        for processes in (1, 2):
+            suggestions.rebuild(k=5, processes=processes, chunk_size=2)
+            rows = FollowSuggestion.objects.filter(
+                user=self.users['me']).order_by('-mutual', 'suggested_id')
+            self.assertEqual(
+                [(row.suggested.username, row.mutual) for row in rows],
+                [('c', 2), ('d', 1)])
+
+    def test_rebuild_computes_before_replacing_rows(self):
+        """ Пока идёт расчёт, прежние рекомендации на месте """
+        suggestions.rebuild()
+        before = FollowSuggestion.objects.count()
+        seen = []
+        compute = suggestions.compute
+
+        def counting(*args, **kwargs):
+            for rows in compute(*args, **kwargs):
+                seen.append(FollowSuggestion.objects.count())
+                yield rows
+
+        with mock.patch('posts.suggestions.compute', counting):
+            suggestions.rebuild(chunk_size=1)
+        self.assertTrue(seen)
+        self.assertEqual(set(seen), {before})
+        self.assertEqual(FollowSuggestion.objects.count(), before)
+
+    def test_rebuild_replaces_rows_per_chunk_of_users(self):
+        """ Строки заменяются по транзакции на кусок пользователей """
+        suggestions.rebuild(k=5)
+        expected = set(FollowSuggestion.objects.values_list(
+            'user_id', 'suggested_id', 'mutual'))
+        FollowSuggestion.objects.create(
+            user=self.users['d'], suggested=self.users['me'], mutual=9)
+        with CaptureQueriesContext(connection) as queries:
+            suggestions.rebuild(k=5, chunk_size=2)
+        deletes = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 3)
+        self.assertEqual(set(FollowSuggestion.objects.values_list(
+            'user_id', 'suggested_id', 'mutual')), expected)
+
+    def test_follow_index_hides_followed_suggestions(self):
+        suggestions.rebuild()
+        Follow.objects.create(user=self.users['me'], author=self.users['d'])
+        self.client.force_login(self.users['me'])
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [item.suggested for item in response.context['suggestions']],
+            [self.users['c']])
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'me'}))
+        self.assertContains(response, 'общих подписок: 2')
+
+
+@override_settings(FOLLOW_LIST_PAGE_SIZE=2)
+class FollowListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='Author')
+        self.readers = [User.objects.create(username=f'Reader{number}')
+                        for number in range(5)]
+        for reader in self.readers:
+            Follow.objects.create(user=reader, author=self.author)
+
+    def test_followers_paginated_by_id(self):
+        """ Подписчики листаются по id от новых к старым """
+        url = reverse('posts:followers', kwargs={'username': 'Author'})
+        seen, after = [], None
+        while True:
+            response = self.client.get(url, {'after': after} if after else {})
+            seen += response.context['users']
+            after = response.context['paginator'].next_cursor
+            if not after:
+                break
+        self.assertEqual(seen, self.readers[::-1])
+        self.assertContains(response, 'Подписчики: 5')
+
+    def test_out_of_range_cursor_returns_first_page(self):
+        url = reverse('posts:followers', kwargs={'username': 'Author'})
+        response = self.client.get(url, {'after': '9' * 30})
+        self.assertEqual(response.context['users'], self.readers[:-3:-1])
+
+    def test_list_counts_from_counters_without_count_queries(self):
+        url = reverse('posts:following', kwargs={'username': 'Reader0'})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.context['users'], [self.author])
+        self.assertContains(response, 'Подписки: 1')
+        self.assertFalse(
+            [query for query in queries if 'COUNT(' in query['sql']])
+        # Автор и его счётчики, затем страница подписок с пользователями.
+        self.assertEqual(len(queries), 2)
@@ -0,0 +1,275 @@
+"""Фоновая подготовка миниатюр sorl-thumbnail.
+
+Миниатюры режутся в пуле потоков сразу после загрузки картинки, а
+шаблонный тег {% thumbnail %} больше не делает этого внутри запроса:
+пока миниатюры нет, в шаблон отдаётся оригинал. При THUMBNAIL_WORKERS = 0
+миниатюры режутся сразу в вызывающем потоке. Картинки, загруженные
+в обход форм, досчитывает команда pregenerate_thumbnails.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connection
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import serialize, tokey
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import feed_cache
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+    return _executor
+
+
+def generate_all(image, geometries=None):
+    """Режет геометрии картинки; возвращает [(геометрия, ошибка)].
+
+    Ключи sorl и ленты сбрасываются один раз на картинку, после всех
+    геометрий: каждый сброс поколения стирает кэш лент всего сайта.
+    """
+    if geometries is None:
+        geometries = all_geometries(source_width(image))
+    errors = []
+    with BatchedKVStore.collect_writes() as written:
+        for geometry_string, options in geometries:
+            try:
+                default.backend.generate(image, geometry_string, **options)
+            except Exception as error:
+                logger.exception('Не удалось подготовить миниатюру %s', image)
+                errors.append((geometry_string, error))
+    if written:
+        default.kvstore.invalidate(written)
+        # Закэшированные ленты ещё ссылаются на оригинал.
+        feed_cache.bump_generation()
+    return errors
+
+
+def _task(media_root, image, geometries):
+    try:
+        # Пока задача ждала в очереди, MEDIA_ROOT могли сменить или
+        # удалить (так делают тесты) — писать туда уже нельзя.
+        if media_root == settings.MEDIA_ROOT and os.path.isdir(media_root):
+            generate_all(image, geometries)
+    finally:
+        with _lock:
+            _pending.discard(image.name)
+        reset_memo()
+        connection.close()
+
+
+def pregenerate(image):
+    """Ставит в очередь все геометрии и варианты, нужные шаблонам."""
+    geometries = list(all_geometries(source_width(image)))
+    if not settings.THUMBNAIL_WORKERS:
+        generate_all(image, geometries)
+        return
+    with _lock:
+        if image.name in _pending:
+            return
+        _pending.add(image.name)
+    _get_executor().submit(_task, settings.MEDIA_ROOT, image, geometries)
+
+
+MIME_TYPES = {
+    'AVIF': 'image/avif',
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+}
+
+
+def available_formats():
+    """Форматы srcset, которые умеет сохранять установленный Pillow."""
+    Image.init()
+    return [format_ for format_ in settings.THUMBNAIL_SRCSET_FORMATS
+            if format_ in Image.SAVE]
+
+
+def variants(geometry_string, options, source_width=None):
+    """Производные геометрии: ширины srcset в каждом доступном формате.
+
+    Если известна ширина исходника, более широкие варианты пропускаются:
+    растянутая картинка весит больше, а деталей в ней не прибавляется.
+    """
+    width, height = map(int, geometry_string.split('x'))
+    widths = [variant_width
+              for variant_width in settings.THUMBNAIL_SRCSET_WIDTHS
+              if source_width is None or variant_width <= source_width]
+    for format_ in available_formats():
+        for variant_width in widths:
+            variant_height = round(height * variant_width / width)
+            yield (f'{variant_width}x{variant_height}',
+                   dict(options, format=format_))
+
+
+def all_geometries(source_width=None):
+    for geometry_string, options in settings.THUMBNAIL_PREGENERATE:
+        yield geometry_string, dict(options)
+        yield from variants(geometry_string, options, source_width)
+
+
+def source_width(image):
+    try:
+        return image.width
+    except (OSError, ValueError):
+        return None
+
+
+class BackgroundThumbnailBackend(ThumbnailBackend):
+    extensions = dict(EXTENSIONS, AVIF='avif')
+
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        # Как в sorl, но с расширением для AVIF.
+        key = tokey(source.key, geometry_string, serialize(options))
+        path = '%s/%s/%s' % (key[:2], key[2:4], key)
+        return '%s%s.%s' % (thumbnail_settings.THUMBNAIL_PREFIX, path,
+                            self.extensions[options['format']])
+
+    def _lookup(self, file_, geometry_string, options):
+        # Те же умолчания, что и в ThumbnailBackend.get_thumbnail,
+        # чтобы имя миниатюры совпало с тем, что создаст generate().
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return source, ImageFile(name, default.storage)
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        if not file_:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        source, thumbnail = self._lookup(file_, geometry_string, options)
+        return default.kvstore.get(thumbnail) or source
+
+    def generate(self, file_, geometry_string, **options):
+        return super().get_thumbnail(file_, geometry_string, **options)
+
+    def prefetch(self, files, geometry_string, **options):
+        """Одним запросом подгружает метаданные миниатюр списка картинок."""
+        geometries = [(geometry_string, options)]
+        geometries += variants(geometry_string, options)
+        thumbnails = [
+            self._lookup(file_, geometry, dict(geometry_options))[1]
+            for file_ in files if file_
+            for geometry, geometry_options in geometries
+        ]
+        if thumbnails:
+            default.kvstore.prefetch(thumbnails)
+
+
+class _Memo(OrderedDict):
+    """LRU не больше THUMBNAIL_MEMO_SIZE ключей."""
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > settings.THUMBNAIL_MEMO_SIZE:
+            self.popitem(last=False)
+
+
+class BatchedKVStore(KVStore):
+    """KV-хранилище sorl с пакетной подгрузкой ключей страницы.
+
+    prefetch() берёт ключи из кэша одним get_many, а недостающие — одним
+    SQL-запросом с IN; результат живёт в памяти потока до конца запроса
+    (задачи пула, картинки в pregenerate_thumbnails) и не больше
+    THUMBNAIL_MEMO_SIZE ключей.
+    """
+    _local = threading.local()
+
+    def _memo(self):
+        memo = getattr(self._local, 'memo', None)
+        if memo is None:
+            memo = self._local.memo = _Memo()
+        return memo
+
+    def prefetch(self, image_files):
+        memo = self._memo()
+        keys = [add_prefix(image_file.key) for image_file in image_files]
+        keys = [key for key in keys if key not in memo]
+        if not keys:
+            return
+        found = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            rows = dict(KVStoreModel.objects.filter(
+                key__in=missing).values_list('key', 'value'))
+            fresh = {key: rows.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(
+                fresh, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+            found.update(fresh)
+        memo.update(found)
+
+    def _get_raw(self, key):
+        memo = self._memo()
+        if key not in memo:
+            return super()._get_raw(key)
+        value = memo[key]
+        return None if value == EMPTY_VALUE else value
+
+    @classmethod
+    @contextmanager
+    def collect_writes(cls):
+        """Копит записанные ключи, чтобы сбросить их одним invalidate."""
+        cls._local.written = written = []
+        try:
+            yield written
+        finally:
+            cls._local.written = None
+
+    def invalidate(self, keys):
+        # Ключ мог лежать в локальном кэше воркеров пустым (EMPTY_VALUE):
+        # delete сбрасывает его у всех, а не только перезаписывает.
+        self.cache.delete_many(keys)
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self._memo()[key] = value
+        written = getattr(self._local, 'written', None)
+        if written is None:
+            self.invalidate([key])
+        else:
+            written.append(key)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        memo = self._memo()
+        for key in keys:
+            memo.pop(key, None)
+
+
+def reset_memo(**kwargs):
+    """Забывает ключи, подгруженные BatchedKVStore в этом потоке."""
+    BatchedKVStore._local.memo = _Memo()
+
+
+request_started.connect(reset_memo)
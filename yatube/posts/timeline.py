@@ -0,0 +1,261 @@
+import heapq
+import time
+from array import array
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from core import metrics
+
+from .models import Follow, Post, TimelineEntry, UserCounter
+from .utils import CursorPaginator, chunked, keyset_newer, keyset_older
+
+User = get_user_model()
+
+metrics.register_counter(
+    'timeline_fanout_posts', 'Посты, разложенные по лентам при записи')
+metrics.register_counter(
+    'timeline_fanout_skipped', 'Посты популярных авторов без раскладки')
+metrics.register_summary(
+    'timeline_merge_sources', 'Число источников в k-way слиянии ленты')
+metrics.register_summary(
+    'timeline_merge_rows', 'Строки, прочитанные из источников ленты')
+metrics.register_summary(
+    'timeline_merge_us', 'Время чтения и слияния ленты, мкс')
+metrics.register_gauge(
+    'timeline_fanout_threshold', 'Порог подписчиков для чтения на лету',
+    lambda: settings.TIMELINE_FANOUT_THRESHOLD)
+
+
+def _entry(user_id, post):
+    return TimelineEntry(user_id=user_id, post_id=post.pk,
+                         author_id=post.author_id, pub_date=post.pub_date)
+
+
+def _bulk_insert(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= settings.TIMELINE_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def heavy_authors(author_ids):
+    """Авторы, чьи посты не раскладываются, а читаются на лету."""
+    heavy = []
+    for start in range(0, len(author_ids), settings.TIMELINE_BATCH_SIZE):
+        chunk = author_ids[start:start + settings.TIMELINE_BATCH_SIZE]
+        heavy += UserCounter.objects.filter(
+            user_id__in=chunk, pull_timeline=True).values_list(
+            'user_id', flat=True)
+    return heavy
+
+
+def promote_heavy_authors(author_ids=None):
+    """Переводит авторов выше порога подписчиков в чтение на лету.
+
+    Вызывается при записи (новая подписка, пересчёт счётчиков), а не
+    при чтении ленты. Флаг pull_timeline не снимается: пока автор был
+    выше порога, его посты и новые подписки не раскладывались, и после
+    спуска ниже порога лента из TimelineEntry была бы неполной.
+    """
+    counters = UserCounter.objects.filter(
+        followers_count__gt=settings.TIMELINE_FANOUT_THRESHOLD,
+        pull_timeline=False)
+    if author_ids is not None:
+        counters = counters.filter(user_id__in=author_ids)
+    return counters.update(pull_timeline=True)
+
+
+def push_post(post):
+    """Раскладывает новый пост по лентам всех подписчиков автора."""
+    if heavy_authors([post.author_id]):
+        metrics.incr('timeline_fanout_skipped')
+        return
+    metrics.incr('timeline_fanout_posts')
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    _bulk_insert(_entry(user_id, post) for user_id in followers.iterator())
+
+
+def add_author(user_id, author_id):
+    """Добавляет в ленту читателя посты автора, на которого он подписался."""
+    if heavy_authors([author_id]):
+        return
+    posts = Post.objects.filter(author_id=author_id).only(
+        'pk', 'author_id', 'pub_date')
+    _bulk_insert(_entry(user_id, post) for post in posts.iterator())
+
+
+def remove_author(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def _insert_select(condition, params):
+    """Раскладывает посты нетяжёлых авторов одним INSERT … SELECT.
+
+    condition отбирает пары подписка-пост (алиасы f и p).
+    """
+    sql = (
+        f'INSERT OR IGNORE INTO {TimelineEntry._meta.db_table} '
+        '(user_id, post_id, author_id, pub_date) '
+        'SELECT f.user_id, p.id, p.author_id, p.pub_date '
+        f'FROM {Follow._meta.db_table} f '
+        f'JOIN {Post._meta.db_table} p ON p.author_id = f.author_id '
+        f'WHERE f.author_id NOT IN (SELECT user_id FROM '
+        f'{UserCounter._meta.db_table} WHERE pull_timeline) AND {condition}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def fill_posts(post_ids):
+    """Раскладывает посты по лентам подписчиков их авторов."""
+    for chunk in chunked(post_ids, settings.TIMELINE_BATCH_SIZE):
+        with transaction.atomic():
+            _insert_select(f'p.id IN ({_placeholders(chunk)})', chunk)
+
+
+def fill_follows(pairs):
+    """Добавляет в ленты посты авторов по парам (читатель, автор)."""
+    for chunk in chunked(pairs, settings.TIMELINE_BATCH_SIZE):
+        values = ', '.join(['(%s, %s)'] * len(chunk))
+        with transaction.atomic():
+            _insert_select(f'(f.user_id, f.author_id) IN (VALUES {values})',
+                           [value for pair in chunk for value in pair])
+
+
+def rebuild(user_ids=None):
+    """Пересобирает ленты с нуля по таблице подписок.
+
+    Читатели обрабатываются кусками по TIMELINE_BATCH_SIZE: каждый
+    кусок стирается и заполняется заново в одной транзакции, так что
+    ленты не бывают пустыми дольше, чем длится вставка одного куска.
+    """
+    if user_ids is None:
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+    user_ids = array('q', user_ids)
+    for start in range(0, len(user_ids), settings.TIMELINE_BATCH_SIZE):
+        chunk = list(user_ids[start:start + settings.TIMELINE_BATCH_SIZE])
+        with transaction.atomic():
+            TimelineEntry.objects.filter(user_id__in=chunk).delete()
+            _insert_select(f'f.user_id IN ({_placeholders(chunk)})', chunk)
+
+
+def get_timeline(user):
+    return TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group')
+
+
+class FeedSource:
+    """Посты одного источника ленты по убыванию (pub_date, id)."""
+    key = ('pub_date', 'pk')
+
+    def __init__(self, queryset):
+        date_field, pk_field = self.key
+        self.queryset = queryset.order_by(f'-{date_field}', f'-{pk_field}')
+
+    def to_post(self, row):
+        return row
+
+    def older(self, cursor, limit):
+        queryset = self.queryset
+        if cursor is not None:
+            queryset = queryset.filter(keyset_older(self.key, *cursor))
+        return [self.to_post(row) for row in queryset[:limit]]
+
+    def newer(self, cursor, limit):
+        queryset = self.queryset.filter(
+            keyset_newer(self.key, *cursor)).reverse()
+        return [self.to_post(row) for row in queryset[:limit]]
+
+    def count(self, limit=None):
+        queryset = self.queryset
+        if limit is not None:
+            queryset = queryset[:limit]
+        return queryset.count()
+
+
+class PushedSource(FeedSource):
+    """Материализованная часть ленты."""
+    key = ('pub_date', 'post_id')
+
+    def to_post(self, entry):
+        return entry.post
+
+
+def _post_key(post):
+    return post.pub_date, post.pk
+
+
+class HybridTimeline:
+    """Лента подписок: разложенные при записи посты плюс посты
+    популярных авторов, которые читаются на лету и сливаются по pub_date.
+    """
+
+    def __init__(self, user):
+        author_ids = list(Follow.objects.filter(user=user).values_list(
+            'author_id', flat=True))
+        heavy = heavy_authors(author_ids)
+        self.sources = [
+            PushedSource(get_timeline(user).exclude(author_id__in=heavy))]
+        self.sources += [
+            FeedSource(Post.objects.filter(author_id=author_id).select_related(
+                'author', 'group'))
+            for author_id in heavy
+        ]
+
+    def _merge(self, parts, limit, reverse):
+        merged = heapq.merge(*parts, key=_post_key, reverse=reverse)
+        return list(islice(merged, limit))
+
+    def _read(self, fetch, limit, reverse):
+        start = time.perf_counter()
+        parts = [fetch(source) for source in self.sources]
+        rows = self._merge(parts, limit, reverse)
+        metrics.observe('timeline_merge_sources', len(parts))
+        metrics.observe('timeline_merge_rows', sum(map(len, parts)))
+        metrics.observe('timeline_merge_us',
+                        int((time.perf_counter() - start) * 1000000))
+        return rows
+
+    def older(self, cursor, limit):
+        return self._read(
+            lambda source: source.older(cursor, limit), limit, True)
+
+    def newer(self, cursor, limit):
+        return self._read(
+            lambda source: source.newer(cursor, limit), limit, False)
+
+    def count(self):
+        return sum(source.count() for source in self.sources)
+
+    def limited_count(self, limit):
+        """Длина ленты, но не больше limit (номерной режим)."""
+        return min(sum(source.count(limit) for source in self.sources),
+                   limit)
+
+    def __getitem__(self, index):
+        # Номерной режим: срез от начала ленты.
+        return self.older(None, index.stop)[index]
+
+
+class HybridCursorPaginator(CursorPaginator):
+
+    def _order(self, object_list):
+        return object_list
+
+    def _fetch_older(self, cursor, limit):
+        return self.object_list.older(cursor, limit)
+
+    def _fetch_newer(self, cursor, limit):
+        return self.object_list.newer(cursor, limit)
@@ -7,6 +7,10 @@ app_name = 'posts'
 urlpatterns = [
     path('', views.index, name='index'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('popular/', views.popular, name='popular'),
+    path('search/', views.search, name='search'),
+    path('export/', views.export, name='export'),
+    path('export/zip/', views.export_archive, name='export_archive'),
     path('profile/<str:username>/follow/',
          views.profile_follow, name='profile_follow'),
     path('profile/<str:username>/unfollow/',
@@ -14,10 +18,16 @@ urlpatterns = [
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
     path('create/', views.post_create, name='post_create'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('profile/<str:username>/followers/',
+         views.followers, name='followers'),
+    path('profile/<str:username>/following/',
+         views.following, name='following'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/comment/', views.add_comment,
          name='add_comment'),
+    path('posts/<int:post_id>/comments/', views.post_comments,
+         name='post_comments'),
     path("404/", views.page_not_found, name="404"),
     path("403/", views.server_error, name="403"),
 ]
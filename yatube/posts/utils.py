@@ -1,11 +1,187 @@
+import base64
+import binascii
+
 from django.conf import settings
 from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+
+# Ключи за пределами INTEGER SQLite база не примет — курсор невалиден.
+PK_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+def chunked(values, size):
+    """Отсортированные значения списками не длиннее size."""
+    values = sorted(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def encode_cursor(pub_date, pk):
+    raw = f'{pub_date.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        pub_date, pk = raw.rsplit('|', 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Некорректный курсор')
+    if pub_date is None or pk not in PK_RANGE:
+        raise ValueError('Некорректный курсор')
+    return pub_date, pk
+
+
+def keyset_older(key, pub_date, pk):
+    date_field, pk_field = key
+    return (Q(**{f'{date_field}__lt': pub_date})
+            | Q(**{date_field: pub_date, f'{pk_field}__lt': pk}))
+
+
+def keyset_newer(key, pub_date, pk):
+    date_field, pk_field = key
+    return (Q(**{f'{date_field}__gt': pub_date})
+            | Q(**{date_field: pub_date, f'{pk_field}__gt': pk}))
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (pub_date, id) без COUNT(*) и OFFSET.
+
+    Страница всегда одна из окна «предыдущая / текущая / следующая»,
+    поэтому number и num_pages считаются без обращения к базе.
+    """
+    is_cursor = True
+    key = ('pub_date', 'pk')
+
+    def __init__(self, object_list, per_page):
+        super().__init__(self._order(object_list), per_page)
+        self.next_cursor = None
+        self.previous_cursor = None
+        self._num_pages = 1
+
+    @property
+    def num_pages(self):
+        return self._num_pages
+
+    def _order(self, object_list):
+        date_field, pk_field = self.key
+        return object_list.order_by(f'-{date_field}', f'-{pk_field}')
+
+    def _cursor(self, row):
+        date_field, pk_field = self.key
+        return encode_cursor(getattr(row, date_field), getattr(row, pk_field))
+
+    def _decode(self, token):
+        return decode_cursor(token)
 
+    def _fetch_older(self, cursor, limit):
+        """Строки старше курсора, от новых к старым."""
+        queryset = self.object_list
+        if cursor is not None:
+            queryset = queryset.filter(keyset_older(self.key, *cursor))
+        return list(queryset[:limit])
 
-def get_page_context(request, queryset):
-    paginator = Paginator(queryset, settings.POST_LENGTH)
+    def _fetch_newer(self, cursor, limit):
+        """Строки новее курсора, от старых к новым."""
+        return list(self.object_list.filter(
+            keyset_newer(self.key, *cursor)).reverse()[:limit])
+
+    def get_page(self, after=None, before=None):
+        try:
+            after = self._decode(after) if after else None
+            before = self._decode(before) if before else None
+        except ValueError:
+            after = before = None
+
+        if before is not None:
+            rows = self._fetch_newer(before, self.per_page + 1)
+            if len(rows) <= self.per_page:
+                # Дошли до начала ленты — отдаём обычную первую страницу.
+                return self.get_page()
+            rows = rows[:self.per_page][::-1]
+            has_previous, has_next = True, True
+        else:
+            rows = self._fetch_older(after, self.per_page + 1)
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = after is not None and bool(rows)
+
+        number = 2 if has_previous else 1
+        self._num_pages = number + 1 if has_next else number
+        self.next_cursor = self._cursor(rows[-1]) if has_next else None
+        self.previous_cursor = (
+            self._cursor(rows[0]) if has_previous else None)
+        return self._get_page(rows, number, self)
+
+
+class CommentCursorPaginator(CursorPaginator):
+    """Комментарии от новых к старым по (created, id)."""
+    key = ('created', 'pk')
+
+
+class FollowCursorPaginator(CursorPaginator):
+    """Подписки от новых к старым по id; курсор — id последней строки."""
+
+    def _order(self, object_list):
+        return object_list.order_by('-pk')
+
+    def _cursor(self, row):
+        return str(row.pk)
+
+    def _decode(self, token):
+        try:
+            pk = int(token)
+        except ValueError:
+            raise ValueError('Некорректный курсор')
+        if pk not in PK_RANGE:
+            raise ValueError('Некорректный курсор')
+        return pk
+
+    def _fetch_older(self, cursor, limit):
+        queryset = self.object_list
+        if cursor is not None:
+            queryset = queryset.filter(pk__lt=cursor)
+        return list(queryset[:limit])
+
+    def _fetch_newer(self, cursor, limit):
+        return list(self.object_list.filter(
+            pk__gt=cursor).reverse()[:limit])
+
+
+class CappedPaginator(Paginator):
+    """Номерная пагинация не глубже settings.MAX_PAGE_NUMBER страниц.
+
+    COUNT(*) и OFFSET ограничены этим окном; ?page= дальше него даёт
+    последнюю доступную страницу, а глубже листают курсором.
+    """
+
+    @cached_property
+    def count(self):
+        limit = settings.MAX_PAGE_NUMBER * self.per_page
+        if isinstance(self.object_list, QuerySet):
+            return self.object_list[:limit].count()
+        return self.object_list.limited_count(limit)
+
+
+def get_page_context(request, queryset, paginator_class=CappedPaginator,
+                     cursor_paginator_class=CursorPaginator):
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    use_cursor = after or before or (
+        page_number is None and settings.PAGINATION_MODE == 'cursor')
+
+    if use_cursor:
+        paginator = cursor_paginator_class(queryset, settings.POST_LENGTH)
+        page_obj = paginator.get_page(after=after, before=before)
+    else:
+        paginator = paginator_class(queryset, settings.POST_LENGTH)
+        page_obj = paginator.get_page(page_number)
 
     return {
         'paginator': paginator,
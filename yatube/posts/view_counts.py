@@ -0,0 +1,96 @@
+"""Буферизованные счётчики просмотров постов.
+
+Просмотр только увеличивает счётчик в памяти воркера. После ответа
+(request_finished) буфер сбрасывается в базу, если прошло
+VIEW_COUNT_FLUSH_INTERVAL секунд или накопилось VIEW_COUNT_FLUSH_SIZE
+просмотров: один UPDATE на каждое различное приращение, в одной
+транзакции. Если база недоступна, просмотры возвращаются в буфер до
+следующего сброса. При выходе процесса буфер сбрасывается через atexit
+(если VIEW_COUNT_FLUSH_AT_EXIT), так что при падении теряется не больше
+одного интервала просмотров воркера.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DatabaseError, transaction
+from django.db.models import F
+
+from core import metrics
+
+from .models import Post
+
+metrics.register_counter('view_counts_flushed', 'Просмотров записано в базу')
+metrics.register_counter('view_counts_flushes', 'Сбросов буфера просмотров')
+
+_buffer = Counter()
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+logger = logging.getLogger(__name__)
+
+
+def record(post_id):
+    with _lock:
+        _buffer[post_id] += 1
+
+
+def pending(post_id):
+    """Просмотры поста, ещё не записанные этим воркером."""
+    return _buffer.get(post_id, 0)
+
+
+def reset():
+    """Отбрасывает буфер, не записывая его."""
+    global _buffer
+    with _lock:
+        _buffer = Counter()
+
+
+def flush():
+    """Записывает накопленные просмотры; возвращает их число."""
+    global _buffer, _last_flush
+    with _lock:
+        counts, _buffer = _buffer, Counter()
+        _last_flush = time.monotonic()
+    if not counts:
+        return 0
+    by_delta = defaultdict(list)
+    for post_id, delta in counts.items():
+        by_delta[delta].append(post_id)
+    try:
+        with transaction.atomic():
+            for delta, post_ids in by_delta.items():
+                Post.objects.filter(pk__in=post_ids).update(
+                    views_count=F('views_count') + delta)
+    except DatabaseError:
+        # Транзакция откатилась целиком — просмотры ждут следующего сброса.
+        with _lock:
+            _buffer.update(counts)
+        logger.exception('Не удалось записать просмотры постов')
+        return 0
+    total = sum(counts.values())
+    metrics.incr('view_counts_flushes')
+    metrics.incr('view_counts_flushed', total)
+    return total
+
+
+def flush_if_due(**kwargs):
+    due = (time.monotonic() - _last_flush
+           >= settings.VIEW_COUNT_FLUSH_INTERVAL
+           or sum(_buffer.values()) >= settings.VIEW_COUNT_FLUSH_SIZE)
+    if due:
+        flush()
+
+
+def flush_at_exit():
+    if settings.VIEW_COUNT_FLUSH_AT_EXIT:
+        flush()
+
+
+request_finished.connect(flush_if_due)
+atexit.register(flush_at_exit)
@@ -1,34 +1,62 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils.http import urlencode
 
+from . import ranking, suggestions, timeline, view_counts
+from .counters import get_counters
+from .export import export_lines, export_zip
+from .feed_cache import feed_cache
 from .forms import CommentForm, PostForm
 from .models import Follow, Group, Post, User
-from .utils import get_page_context
+from .search import Search, SearchPaginator
+from .thumbnails import pregenerate
+from .utils import (
+    CommentCursorPaginator, FollowCursorPaginator, get_page_context,
+)
 
 User = get_user_model()
 
 
+def feed(queryset):
+    """Общие связи и порядок лент постов — для страниц и API."""
+    return queryset.select_related('author', 'group').order_by(
+        '-pub_date', '-pk')
+
+
 def index(request):
-    context = get_page_context(
-        request, Post.objects.select_related(
-            'author', 'group').order_by('-pub_date'))
+    context = get_page_context(request, feed(Post.objects.all()))
+    context['feed_cache'] = feed_cache(request, 'index')
     return render(request, 'posts/index.html', context)
 
 
+def popular(request):
+    paginator = Paginator(ranking.top(), settings.POST_LENGTH)
+    context = {
+        'paginator': paginator,
+        'page_obj': paginator.get_page(request.GET.get('page')),
+    }
+    return render(request, 'posts/popular.html', context)
+
+
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     context = {
         'group': group,
-
+        'feed_cache': feed_cache(request, 'group', group.pk),
     }
-    context.update(get_page_context(request, group.posts.all()))
+    context.update(get_page_context(request, feed(group.posts.all())))
     return render(request, 'posts/group_list.html', context)
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('counters'), username=username)
     if request.user.is_authenticated:
         following = Follow.objects.filter(
             user=request.user, author=author
@@ -38,26 +66,113 @@ def profile(request, username):
     context = {
         'author': author,
         'following': following,
+        'counters': get_counters(author),
+        'feed_cache': feed_cache(request, 'profile', author.pk),
     }
-    context.update(get_page_context(request, author.posts.all()))
+    if request.user == author:
+        context['suggestions'] = suggestions.for_user(request.user)
+    context.update(get_page_context(request, feed(author.posts.all())))
     return render(request, 'posts/profile.html', context)
 
 
+def follow_list(request, username, direction):
+    """Подписчики автора или его подписки; число — из UserCounter."""
+    author = get_object_or_404(
+        User.objects.select_related('counters'), username=username)
+    if direction == 'followers':
+        follows = Follow.objects.filter(author=author).select_related('user')
+    else:
+        follows = Follow.objects.filter(user=author).select_related('author')
+    paginator = FollowCursorPaginator(follows, settings.FOLLOW_LIST_PAGE_SIZE)
+    page_obj = paginator.get_page(
+        after=request.GET.get('after'), before=request.GET.get('before'))
+    context = {
+        'author': author,
+        'counters': get_counters(author),
+        'direction': direction,
+        'users': [follow.user if direction == 'followers' else follow.author
+                  for follow in page_obj],
+        'paginator': paginator,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/follow_list.html', context)
+
+
+def followers(request, username):
+    return follow_list(request, username, 'followers')
+
+
+def following(request, username):
+    return follow_list(request, username, 'following')
+
+
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__counters', 'group'), pk=post_id)
     author = post.author
-    post_comments = post.comments.all()
+    view_counts.record(post.pk)
+    comments = comments_page(post)
     form = CommentForm()
     context = {
         'author': author,
+        'counters': get_counters(author),
         'post': post,
         'form': form,
-        'comments': post_comments,
+        'comments': comments,
     }
 
     return render(request, "posts/post_detail.html", context)
 
 
+def comments_page(post, after=None):
+    """Страница комментариев поста; курсор следующей — в paginator."""
+    paginator = CommentCursorPaginator(
+        post.comments.select_related('author'), settings.COMMENTS_PAGE_SIZE)
+    return paginator.get_page(after=after)
+
+
+def post_comments(request, post_id):
+    """HTML-фрагмент следующей страницы комментариев для «Показать ещё»."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comments = comments_page(post, after=request.GET.get('after'))
+    return render(request, 'posts/includes/comments.html', {
+        'post': post,
+        'comments': comments,
+    })
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = SearchPaginator(Search(query), settings.POST_LENGTH)
+    page_obj = paginator.get_page(
+        after=request.GET.get('after'), before=request.GET.get('before'))
+    context = {
+        'query': query,
+        'page_query': urlencode({'q': query}) + '&',
+        'paginator': paginator,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@login_required
+def export(request):
+    response = StreamingHttpResponse(
+        export_lines(request.user), content_type='application/x-ndjson')
+    response['Content-Disposition'] = (
+        f'attachment; filename="{request.user.username}.jsonl"')
+    return response
+
+
+@login_required
+def export_archive(request):
+    response = StreamingHttpResponse(
+        export_zip(request.user), content_type='application/zip')
+    response['Content-Disposition'] = (
+        f'attachment; filename="{request.user.username}.zip"')
+    return response
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -65,6 +180,8 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if post.image:
+            transaction.on_commit(lambda: pregenerate(post.image))
         username = request.user
         return redirect('posts:profile', username)
 
@@ -84,7 +201,9 @@ def post_edit(request, post_id):
     form = PostForm(request.POST or None, files=request.FILES or None,
                     instance=post)
     if form.is_valid():
-        form.save()
+        post = form.save()
+        if 'image' in form.changed_data and post.image:
+            transaction.on_commit(lambda: pregenerate(post.image))
         return redirect('posts:post_detail', post_id)
 
     context = {
@@ -121,10 +240,12 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     context = {
-        'is_index': False,
+        'feed_cache': feed_cache(request, 'follow', request.user.pk),
+        'suggestions': suggestions.for_user(request.user),
     }
     context.update(get_page_context(
-        request, Post.objects.filter(author__following__user=request.user)))
+        request, timeline.HybridTimeline(request.user),
+        cursor_paginator_class=timeline.HybridCursorPaginator))
     return render(request, 'posts/follow.html', context)
 
 
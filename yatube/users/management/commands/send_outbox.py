@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users import outbox
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди пачками через одно соединение'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Разобрать очередь и выйти, не дожидаясь новых писем')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument(
+            '--interval', type=float, default=settings.OUTBOX_POLL_INTERVAL,
+            help='Пауза между опросами пустой очереди, секунд')
+
+    def handle(self, *args, **options):
+        connection = outbox.open_connection()
+        processed = 0
+        try:
+            while True:
+                count = outbox.drain(connection, options['batch_size'])
+                processed += count
+                if count:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано писем: {processed}'))
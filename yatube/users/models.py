@@ -0,0 +1,29 @@
+from django.db import models
+
+
+class OutboxEmail(models.Model):
+    """Письмо, ждущее отправки воркером send_outbox.
+
+    Пишется в той же транзакции, что и изменение, из-за которого
+    отправляется; после отправки строка удаляется. next_attempt_at
+    пуст у писем, исчерпавших попытки.
+    """
+    subject = models.CharField(max_length=255, verbose_name='Тема')
+    body = models.TextField(verbose_name='Текст')
+    from_email = models.CharField(max_length=255, verbose_name='Отправитель')
+    to = models.TextField(verbose_name='Получатели',
+                          help_text='Адреса через запятую')
+    created = models.DateTimeField(auto_now_add=True,
+                                   verbose_name='Создано')
+    attempts = models.PositiveSmallIntegerField(
+        default=0, verbose_name='Попыток')
+    next_attempt_at = models.DateTimeField(
+        null=True, db_index=True, verbose_name='Следующая попытка')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+
+    class Meta:
+        verbose_name = 'Письмо в очереди'
+        verbose_name_plural = 'Очередь писем'
+
+    def __str__(self):
+        return f'{self.subject} → {self.to}'
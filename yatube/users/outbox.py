@@ -0,0 +1,113 @@
+"""Очередь исходящих писем (transactional outbox).
+
+Запрос только добавляет строку в OutboxEmail в своей транзакции: письмо
+уйдёт, только если изменение закоммичено, а медленный почтовый сервер
+не задерживает ответ. Команда send_outbox отправляет письма пачками
+через одно соединение и откладывает неудачные с экспоненциальной паузой.
+Пачку сначала занимают, сдвигая next_attempt_at на OUTBOX_CLAIM_TIMEOUT
+вперёд, поэтому несколько процессов send_outbox не отправят одно письмо
+дважды; если процесс упал, письма снова станут готовы после этой паузы.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from core import metrics
+
+from .models import OutboxEmail
+
+metrics.register_counter('outbox_sent', 'Отправлено писем')
+metrics.register_counter('outbox_retried', 'Писем отложено после ошибки')
+metrics.register_counter('outbox_dead', 'Писем, исчерпавших попытки')
+metrics.register_summary('outbox_send_ms', 'Время отправки письма, мс')
+metrics.register_gauge(
+    'outbox_depth', 'Писем в очереди',
+    lambda: OutboxEmail.objects.filter(next_attempt_at__isnull=False).count())
+
+
+def enqueue(subject, body, from_email, recipient_list):
+    """Кладёт письмо в очередь в текущей транзакции."""
+    return OutboxEmail.objects.create(
+        subject=subject, body=body, from_email=from_email,
+        to=','.join(recipient_list), next_attempt_at=timezone.now())
+
+
+def backoff(attempts):
+    delay = settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.OUTBOX_MAX_RETRY_DELAY))
+
+
+def _fail(message, error):
+    message.attempts += 1
+    message.last_error = f'{type(error).__name__}: {error}'
+    if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        message.next_attempt_at = None
+        metrics.incr('outbox_dead')
+    else:
+        message.next_attempt_at = timezone.now() + backoff(message.attempts)
+        metrics.incr('outbox_retried')
+    message.save(update_fields=['attempts', 'last_error', 'next_attempt_at'])
+
+
+def _reconnect(connection):
+    # После ошибки соединение может быть разорвано сервером.
+    connection.close()
+    try:
+        connection.open()
+    except OSError:
+        pass
+
+
+def claim(batch_size):
+    """Занимает пачку готовых писем за этим процессом."""
+    now = timezone.now()
+    pks = list(OutboxEmail.objects.filter(next_attempt_at__lte=now).order_by(
+        'next_attempt_at', 'pk').values_list('pk', flat=True)[:batch_size])
+    if not pks:
+        return []
+    # Условие на next_attempt_at повторяется в UPDATE: письма, которые
+    # успел занять другой процесс, сюда уже не попадут. Метка занятия
+    # своя у каждого вызова, по ней и читаются свои строки.
+    lease = now + timedelta(seconds=settings.OUTBOX_CLAIM_TIMEOUT)
+    claimed = OutboxEmail.objects.filter(
+        pk__in=pks, next_attempt_at__lte=now).update(next_attempt_at=lease)
+    if not claimed:
+        return []
+    return list(OutboxEmail.objects.filter(
+        pk__in=pks, next_attempt_at=lease).order_by('pk'))
+
+
+def drain(connection, batch_size=None):
+    """Отправляет одну пачку готовых к отправке писем.
+
+    Возвращает число обработанных писем; 0 — готовых писем нет.
+    """
+    batch = claim(batch_size or settings.OUTBOX_BATCH_SIZE)
+    sent = []
+    for message in batch:
+        email = EmailMessage(
+            message.subject, message.body, message.from_email,
+            message.to.split(','), connection=connection)
+        started = time.monotonic()
+        try:
+            email.send()
+        except Exception as error:
+            _fail(message, error)
+            _reconnect(connection)
+            continue
+        metrics.observe(
+            'outbox_send_ms', int((time.monotonic() - started) * 1000))
+        sent.append(message.pk)
+    if sent:
+        OutboxEmail.objects.filter(pk__in=sent).delete()
+        metrics.incr('outbox_sent', len(sent))
+    return len(batch)
+
+
+def open_connection():
+    connection = get_connection(fail_silently=False)
+    connection.open()
+    return connection
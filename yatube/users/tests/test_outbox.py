@@ -0,0 +1,70 @@
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from users import outbox
+from users.models import OutboxEmail
+
+
+class OutboxTests(TestCase):
+    def test_signup_enqueues_instead_of_sending(self):
+        """ Регистрация кладёт письмо в очередь, а не отправляет его """
+        self.client.post(reverse('users:signup'), {
+            'first_name': 'Лев', 'last_name': 'Толстой',
+            'username': 'leo', 'email': 'leo@example.com',
+            'password1': 'Sup3r-secret', 'password2': 'Sup3r-secret',
+        })
+        self.assertEqual(mail.outbox, [])
+        message = OutboxEmail.objects.get()
+        self.assertEqual(message.to, 'leo@example.com')
+        self.assertIn('Лев Толстой', message.body)
+
+    def test_worker_sends_and_removes_messages(self):
+        for number in range(3):
+            outbox.enqueue('Тема', 'Текст', 'from@example.com',
+                           [f'user{number}@example.com'])
+        call_command('send_outbox', once=True, batch_size=2,
+                     stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_failed_message_is_retried_with_backoff(self):
+        """ Неудачное письмо откладывается, а после лимита — остаётся """
+        message = outbox.enqueue(
+            'Тема', 'Текст', 'from@example.com', ['to@example.com'])
+        connection = outbox.open_connection()
+        with mock.patch('django.core.mail.EmailMessage.send',
+                        side_effect=OSError('timeout')):
+            outbox.drain(connection)
+        message.refresh_from_db()
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertIn('timeout', message.last_error)
+        self.assertEqual(outbox.drain(connection), 0)
+
+        with self.settings(OUTBOX_MAX_ATTEMPTS=2), mock.patch(
+                'django.core.mail.EmailMessage.send',
+                side_effect=OSError('timeout')):
+            OutboxEmail.objects.update(next_attempt_at=timezone.now())
+            outbox.drain(connection)
+        message.refresh_from_db()
+        self.assertIsNone(message.next_attempt_at)
+
+    def test_claimed_messages_skipped_by_other_workers(self):
+        """ Занятые одним процессом письма не достаются другому """
+        for number in range(3):
+            outbox.enqueue('Тема', 'Текст', 'from@example.com',
+                           [f'user{number}@example.com'])
+        first = outbox.claim(2)
+        second = outbox.claim(10)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({message.pk for message in first}
+                         & {message.pk for message in second})
+        self.assertEqual(outbox.claim(10), [])
+        self.assertEqual(outbox.drain(outbox.open_connection()), 0)
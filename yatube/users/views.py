@@ -1,9 +1,10 @@
 from django.contrib.auth import logout
-from django.core.mail import send_mail
+from django.db import transaction
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
 from django.views.generic import CreateView
 
+from . import outbox
 from .forms import CreationForm
 
 
@@ -16,15 +17,18 @@ class SignUp(CreateView):
         email = form.cleaned_data['email']
         first_name = form.cleaned_data['first_name']
         last_name = form.cleaned_data['last_name']
-        send_mail('Подтверждение регистрации на Yatube',
-                  f'{first_name} {last_name}, вы зарегистрированы!',
-                  'Yatube.ru <admin@yatube.ru>', [email], fail_silently=False)
-        return super().form_valid(form)
+        # Письмо уходит из очереди, только если пользователь сохранён.
+        with transaction.atomic():
+            response = super().form_valid(form)
+            outbox.enqueue('Подтверждение регистрации на Yatube',
+                           f'{first_name} {last_name}, вы зарегистрированы!',
+                           'Yatube.ru <admin@yatube.ru>', [email])
+        return response
 
 
 def send_mail_ls(email):
-    send_mail('Подтверждение регистрации Yatube', 'Вы зарегистрированы!',
-              'Yatube.ru <admin@yatube.ru>', [email], fail_silently=False)
+    outbox.enqueue('Подтверждение регистрации Yatube', 'Вы зарегистрированы!',
+                   'Yatube.ru <admin@yatube.ru>', [email])
 
 
 def pagelogout(request):
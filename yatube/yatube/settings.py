@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+from datetime import timedelta
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -19,9 +20,40 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 SECRET_KEY = 'o@3t*2(+js+4)16-!b(_^wu7tj&av_9g4k4hd&halqjoab_qqu'
 
 CACHES = {
+    # Локальный LRU в каждом воркере поверх общего для всех воркеров кэша.
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TwoLevelCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 60,
+            'CHECK_INTERVAL': 1,
+            # Ключи, которые перезаписываются на месте: локальная копия
+            # в других воркерах устарела бы до LOCAL_TIMEOUT.
+            'VOLATILE_PREFIXES': [
+                'feed:', 'metrics:', 'page-modified:', 'popular:',
+                'ratelimit:', 'replica:'],
+            'COUNTERS': 'counters',
+        },
+    },
+    # Фрагменты лент, страницы и ключи миниатюр: одна страница ленты —
+    # около сотни ключей, при переполнении удаляется случайная треть.
+    'shared': {
+        'BACKEND': 'core.cache.LockedFileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 200000,
+        },
+    },
+    # Счётчики (поколение лент, метрики, ограничение частоты) опираются
+    # на атомарные add и incr и не вытесняются, пока не истекут.
+    'counters': {
+        'BACKEND': 'core.cache.DurableFileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'counters'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
 
 DEBUG = True
@@ -46,6 +78,7 @@ INSTALLED_APPS = [
     'posts.apps.PostsConfig',
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
     'debug_toolbar',
 ]
@@ -53,6 +86,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'posts.middleware.AnonymousPageCacheMiddleware',
+    'core.replica.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -60,6 +95,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'core.ratelimit.RateLimitMiddleware',
 ]
 
 INTERNAL_IPS = [
@@ -91,7 +127,45 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        # Соединение переиспользуется запросами воркера до минуты.
+        'CONN_MAX_AGE': 60,
+    },
+    # Копия default, которую обновляет sync_replica (core.replica).
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['core.replica.ReplicaRouter']
+REPLICA_DATABASE = 'replica'
+# Вью, которые при GET читают с реплики; списки админки — всегда.
+REPLICA_VIEWS = [
+    'posts:index',
+    'posts:group_posts',
+    'posts:profile',
+    'posts:post_detail',
+]
+REPLICA_SYNC_INTERVAL = 5
+# Ключ кэша с версией данных: реплика свежая, пока она не ушла вперёд.
+REPLICA_VERSION_KEY = 'feed:generation'
+# Клиент читает с основной базы, пока реплика не получит его запись
+# (core.replica); это лишь предел на случай остановки синхронизации.
+REPLICA_PIN_SECONDS = 3600
+
+# PRAGMA для каждого нового соединения SQLite (core.db); у отдельной
+# базы их можно переопределить ключом PRAGMAS в DATABASES.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    # Ждать блокировку писателя, мс, вместо «database is locked».
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — размер в КиБ: 64 МиБ кэша страниц.
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
 }
 
 
@@ -126,9 +200,95 @@ TEMPLATES_DIRS = (os.path.join(BASE_DIR, '/templates'),)
 STATICFILES_DIRS = (os.path.join(BASE_DIR, '/static'),)
 STATIC_URL = '/static/'
 POST_LENGTH = 10
+COMMENTS_PAGE_SIZE = 20
+FOLLOW_LIST_PAGE_SIZE = 50
+# Просмотры копятся в памяти воркера и пишутся в базу не чаще раза
+# в VIEW_COUNT_FLUSH_INTERVAL секунд или по достижении VIEW_COUNT_FLUSH_SIZE.
+VIEW_COUNT_FLUSH_INTERVAL = 10
+VIEW_COUNT_FLUSH_SIZE = 1000
+# Остаток буфера пишется при выходе процесса.
+VIEW_COUNT_FLUSH_AT_EXIT = True
+# Метрики копятся в памяти воркера и пишутся в кэш не чаще раза
+# в METRICS_FLUSH_INTERVAL секунд.
+METRICS_FLUSH_INTERVAL = 10
+# 'cursor' — пагинация по (pub_date, id), 'numbered' — по номерам страниц.
+# Номерной режим всегда доступен явным параметром ?page=.
+PAGINATION_MODE = 'cursor'
+# Глубже в номерном режиме не листается: COUNT(*) и OFFSET ограничены.
+MAX_PAGE_NUMBER = 100
+# Размер пачки при раскладке постов по лентам подписчиков.
+TIMELINE_BATCH_SIZE = 500
+# Посты авторов с большим числом подписчиков не раскладываются по лентам,
+# а дочитываются при открытии ленты.
+TIMELINE_FANOUT_THRESHOLD = 10000
+# Фрагменты лент сбрасываются сигналами, поэтому TTL может быть большим.
+FEED_CACHE_TTL = 300
+# Страницы, которые целиком кэшируются для анонимных читателей.
+PAGE_CACHE_VIEWS = [
+    'posts:index',
+    'posts:group_posts',
+    'posts:profile',
+    'posts:post_detail',
+    'posts:post_comments',
+    'posts:popular',
+    'posts:followers',
+    'posts:following',
+]
+PAGE_CACHE_TTL = 300
+# Сколько помнить Last-Modified страницы, которую перестали запрашивать.
+PAGE_MODIFIED_TTL = 24 * 60 * 60
+# Вкладка «Популярное»: посты за POPULAR_WINDOW, вес которых затухает
+# вдвое каждые POPULAR_HALF_LIFE. Рейтинг пересчитывает rank_popular.
+POPULAR_WINDOW = timedelta(days=7)
+POPULAR_HALF_LIFE = timedelta(hours=12)
+POPULAR_WEIGHTS = {'comments': 3, 'views': 0.1, 'follows': 5}
+POPULAR_SIZE = 100
+POPULAR_BATCH_SIZE = 500
+POPULAR_INTERVAL = 300
+# Рекомендации подписок: сколько хранить и показывать на пользователя
+# и сколько пользователей считать одним заданием suggest_follows.
+SUGGESTIONS_K = 20
+SUGGESTIONS_SHOWN = 5
+SUGGESTIONS_CHUNK_SIZE = 1000
+# Сколько строк за раз читает rebuild_search_index.
+SEARCH_CHUNK_SIZE = 2000
+# Сколько строк import_content вставляет одной транзакцией.
+IMPORT_BATCH_SIZE = 1000
+# Сколько строк выгрузка читает из базы за раз.
+EXPORT_CHUNK_SIZE = 500
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+# Token bucket на запись: 'N/s|m|h|d' — ёмкость N и пополнение N за период.
+# user — для авторизованных, ip — для анонимов; по умолчанию только POST.
+RATE_LIMITS = {
+    'posts:post_create': {'user': '20/m'},
+    'posts:add_comment': {'user': '30/m'},
+    'posts:profile_follow': {'user': '60/m', 'methods': ('GET', 'POST')},
+    'users:signup': {'ip': '10/m'},
+}
+# Очередь писем: send_outbox разбирает её пачками, неудачные письма
+# откладываются на OUTBOX_RETRY_DELAY * 2^(попытка - 1) секунд.
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_POLL_INTERVAL = 5
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_DELAY = 30
+OUTBOX_MAX_RETRY_DELAY = 3600
+# На столько письма пачки заняты одним процессом; с запасом на отправку.
+OUTBOX_CLAIM_TIMEOUT = 300
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+THUMBNAIL_BACKEND = 'posts.thumbnails.BackgroundThumbnailBackend'
+THUMBNAIL_KVSTORE = 'posts.thumbnails.BatchedKVStore'
+# Потоки фоновой нарезки миниатюр; 0 — резать в вызывающем потоке.
+THUMBNAIL_WORKERS = 2
+# Сколько ключей миниатюр поток держит в памяти между сбросами.
+THUMBNAIL_MEMO_SIZE = 1000
+# Геометрии из шаблонов лент и поста, готовятся сразу после загрузки.
+THUMBNAIL_PREGENERATE = [
+    ('960x339', {'crop': 'center', 'upscale': True}),
+]
+# Варианты для <picture>/srcset; форматы без поддержки в Pillow пропускаются.
+THUMBNAIL_SRCSET_WIDTHS = [480, 960, 1440]
+THUMBNAIL_SRCSET_FORMATS = ['AVIF', 'WEBP', 'JPEG']
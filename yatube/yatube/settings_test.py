@@ -0,0 +1,26 @@
+"""Настройки для тестов: manage.py test и pytest подключают их сами."""
+import atexit
+import shutil
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+# Тесты чистят кэш — общий кэш разработки они трогать не должны.
+CACHES['shared'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'tests',
+}
+CACHES['counters'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'tests-counters',
+    'OPTIONS': {'MAX_ENTRIES': 100000},
+}
+# Тестовая база к выходу процесса уже удалена.
+VIEW_COUNT_FLUSH_AT_EXIT = False
+# Загрузки и миниатюры — во временный каталог вне репозитория.
+MEDIA_ROOT = tempfile.mkdtemp(prefix='yatube-media-')
+atexit.register(shutil.rmtree, MEDIA_ROOT, True)
+# Миниатюры режутся в потоке теста: фоновые потоки пережили бы тест
+# и писали бы в его базу и MEDIA_ROOT уже после teardown.
+THUMBNAIL_WORKERS = 0
@@ -14,6 +14,8 @@ urlpatterns = [
     path('auth/', include('users.urls', namespace='users')),
     path('about/', include('about.urls', namespace='about')),
     path('auth/', include('django.contrib.auth.urls')),
+    path('api/v1/', include('api.urls', namespace='api')),
+    path('', include('core.urls', namespace='core')),
     path('', include('posts.urls', namespace='posts')),
 ]
 